@@ -0,0 +1,232 @@
+import os
+# Chạy không cần màn hình
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pygame
+
+import done
+
+MESSAGE_LENGTHS = [0, 55, 64, 1024, 16 * 1024, 64 * 1024]
+MEMORY_LENGTHS = [64 * 1024, 256 * 1024]
+FRAME_MESSAGE = "The quick brown fox jumps over the lazy dog" * 3
+
+def make_message(length):
+    # Deterministic printable text of the given length
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 "
+    return ''.join(alphabet[(i * 7 + i // 37) % len(alphabet)] for i in range(length))
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "max_ms": samples[-1] * 1000,
+        "samples": len(samples),
+    }
+
+def update_and_wait(visualizer, message):
+    # Long messages are traced on a worker thread; include that time
+    visualizer.update_message(message)
+    visualizer.finish_trace()
+
+def bench_update_message(repeat):
+    results = {}
+    visualizer = done.SHA256Visualizer()
+    for length in MESSAGE_LENGTHS:
+        message = make_message(length)
+        runs = repeat if length <= 1024 else max(1, repeat // 10)
+        results[str(length)] = summary(timed(lambda: update_and_wait(visualizer, message), runs))
+    return results
+
+def frame_states(visualizer):
+    # (name, setup) for every steady-state and animated phase of steps 1-5
+    message = FRAME_MESSAGE
+
+    def step1(animation_step):
+        def setup(frame):
+            visualizer.current_step = 1
+            visualizer.conversion_complete = False
+            visualizer.current_char_index = frame % len(message)
+            visualizer.converted_chars = visualizer.current_char_index
+            visualizer.binary_converter.start_conversion(visualizer.message_bytes[visualizer.current_char_index])
+            visualizer.binary_converter.animation_step = animation_step
+        return setup
+
+    def static(step):
+        def setup(frame):
+            visualizer.current_step = step
+            visualizer.conversion_complete = True
+            visualizer.converted_chars = len(message)
+            visualizer.show_bits = False
+        return setup
+
+    def step4(frame):
+        static(4)(frame)
+        visualizer.current_w = frame % 64
+
+    def step5(frame):
+        static(5)(frame)
+        visualizer.calculation_h = frame % 64
+        visualizer.final_step5 = False
+
+    def step5_bits(frame):
+        step5(frame)
+        visualizer.show_bits = True
+
+    def step5_final(frame):
+        static(5)(frame)
+        visualizer.calculation_h = 63
+        visualizer.final_step5 = True
+
+    return [
+        ("step1_converting", step1(5)),
+        ("step1_converted", static(1)),
+        ("step2", static(2)),
+        ("step3", static(3)),
+        ("step4_current_w", step4),
+        ("step5_calculation_h", step5),
+        ("step5_bits", step5_bits),
+        ("step5_final", step5_final),
+    ]
+
+def timed_render(screen, visualizer):
+    started = time.perf_counter()
+    dirty = visualizer.render(screen)
+    if dirty is None:
+        pygame.display.flip()
+    elif dirty:
+        pygame.display.update(dirty)
+    return time.perf_counter() - started
+
+def bench_frames(screen, frames):
+    results = {}
+    visualizer = done.SHA256Visualizer()
+    visualizer.update_message(FRAME_MESSAGE)
+    for name, setup in frame_states(visualizer):
+        # Warm the text cache first, then measure steady-state frames
+        for frame in range(64):
+            setup(frame)
+            visualizer.draw(screen)
+
+        draw_samples = []
+        render_samples = []
+        cached_samples = []
+        for frame in range(frames):
+            setup(frame)
+            started = time.perf_counter()
+            visualizer.draw(screen)
+            pygame.display.flip()
+            draw_samples.append(time.perf_counter() - started)
+
+            # Without a cleared cache every sample after the first is a cache hit, and a
+            # static state with an unchanged key returns [] without drawing anything
+            setup(frame)
+            visualizer.frame_cache.clear()
+            if visualizer.frame_key() == visualizer.last_frame:
+                visualizer.invalidate()
+            render_samples.append(timed_render(screen, visualizer))
+
+            # The same frame again, served from the cache (only frames slow enough to be kept)
+            key = visualizer.cache_key(visualizer.frame_key(), visualizer.layout_key())
+            if key in visualizer.frame_cache.frames:
+                visualizer.invalidate()
+                cached_samples.append(timed_render(screen, visualizer))
+        results[name] = {"draw": summary(draw_samples), "render": summary(render_samples)}
+        if cached_samples:
+            results[name]["render_cached"] = summary(cached_samples)
+    return results
+
+def bench_memory(lengths):
+    results = {}
+    for length in lengths:
+        message = make_message(length)
+        visualizer = done.SHA256Visualizer()
+        tracemalloc.start()
+        update_and_wait(visualizer, message)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[str(length)] = {"peak_bytes": peak, "retained_bytes": current}
+    return results
+
+def compare(old, new, threshold):
+    # Prints every timing that got slower than threshold; returns the number of regressions
+    regressions = 0
+
+    def walk(path, a, b):
+        nonlocal regressions
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in a:
+                if key in b:
+                    walk(path + [key], a[key], b[key])
+        elif path and path[-1] in ("median_ms", "peak_bytes") and a:
+            ratio = b / a
+            flag = "REGRESSION" if ratio > 1 + threshold else ""
+            if flag:
+                regressions += 1
+            print(f"{'/'.join(path):60} {a:12.3f} -> {b:12.3f}  x{ratio:5.2f} {flag}")
+
+    walk([], old["results"], new["results"])
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SHA-256 visualizer benchmarks")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per update_message length")
+    parser.add_argument("--frames", type=int, default=200, help="measured frames per step")
+    parser.add_argument("--memory-length", type=int, action="append",
+                        help="message length for the peak-memory run (repeatable, default 64K and 256K)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown ratio reported as a regression (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    screen = done.init_display()
+
+    results = {
+        "update_message": bench_update_message(args.repeat),
+        "frames": bench_frames(screen, args.frames),
+        "memory": bench_memory(args.memory_length or MEMORY_LENGTHS),
+    }
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "video_driver": os.environ.get('SDL_VIDEODRIVER'),
+        },
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    pygame.quit()
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
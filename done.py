@@ -1,15 +1,35 @@
+import time
+STARTED_AT = time.perf_counter()
+
+import os
+# Keep pygame's banner out of stdout, which carries the trace in --headless mode
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
 import pygame
 import pygame.font
+try:
+    import numpy as np
+except ImportError:  # only the batch engine needs NumPy
+    np = None
 from hashlib import sha256
-import time
-
-pygame.init()
-pygame.font.init()
+from collections import OrderedDict, deque
+from array import array
+import argparse
+import asyncio
+import cProfile
+import concurrent.futures
+import csv
+import io
+import json
+import mmap
+import re
+import socket
+import struct
+import sys
+import threading
 
 WIDTH = 1200
 HEIGHT = 800
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("SHA-256 Algorithm Visualization")
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -21,12 +41,892 @@ YELLOW = (255, 255, 0)
 LIGHT_BLUE = (173, 216, 230)
 
 FONT_SIZE = 20
-font = pygame.font.SysFont('Segoe UI Symbol', FONT_SIZE)
-title_font = pygame.font.SysFont('Arial', 30, bold=True)
-small_font = pygame.font.SysFont('Segoe UI Symbol', 16)
+
+class PlaybackClock:
+    # Animation time: a real-time source scaled by the playback speed.
+    # The source is time.time live, or a VirtualClock for replays and offline runs.
+    SPEEDS = (0.25, 0.5, 1, 2, 4, 8, 16)
+
+    def __init__(self, source=time.time, speed=1):
+        self.source = source
+        self.speed = 1
+        self.origin = self.offset = source()
+        self.set_speed(speed)
+
+    def __call__(self):
+        return self.offset + (self.source() - self.origin) * self.speed
+
+    def set_speed(self, speed):
+        # Re-anchored so animation time never jumps when the speed changes
+        now = self()
+        self.origin = self.source()
+        self.offset = now
+        self.speed = min(max(speed, self.SPEEDS[0]), self.SPEEDS[-1])
+
+    def change_speed(self, steps):
+        speeds = self.SPEEDS
+        index = min(range(len(speeds)), key=lambda i: abs(speeds[i] - self.speed))
+        self.set_speed(speeds[max(0, min(index + steps, len(speeds) - 1))])
+
+    def real_delay(self, tick):
+        # Real seconds until the animation reaches tick
+        return (tick - self()) / self.speed
+
+class VirtualClock:
+    # Stepped stand-in for time.time(): time only moves when it is advanced
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += max(0.0, seconds)
+
+# Created by init_display() so the SHA-256 code can be used without a window
+screen = None
+font = None
+title_font = None
+small_font = None
+
+fonts_from_cache = False
+
+# Resolved font file paths, so warm starts skip the system font scan
+FONT_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                               'sha256-visualizer', 'fonts.json')
+
+def load_font_cache():
+    try:
+        with open(FONT_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_font_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+        with open(FONT_CACHE_PATH, 'w') as f:
+            json.dump(cache, f, indent=1)
+    except OSError:
+        pass
+
+def cached_sys_font(name, size, bold, cache):
+    # Same result as pygame.font.SysFont, but the path lookup is remembered in cache.
+    # Returns (font, True if the path came from the cache)
+    key = f"{name}:{'bold' if bold else 'regular'}"
+    entry = cache.get(key)
+    hit = entry is not None and (entry[0] is None or os.path.exists(entry[0]))
+    if not hit:
+        path = pygame.font.match_font(name, bold)
+        # No bold file for this family: SysFont emboldens the regular one
+        synthetic_bold = bold and path == pygame.font.match_font(name)
+        entry = cache[key] = [path, synthetic_bold]
+    path, synthetic_bold = entry
+    loaded = pygame.font.Font(path, size)
+    if synthetic_bold or (bold and path is None):
+        loaded.set_bold(True)
+    return loaded, hit
+
+def load_fonts():
+    global font, title_font, small_font, fonts_from_cache
+    pygame.font.init()
+    cache = load_font_cache()
+    font, hit_font = cached_sys_font('Segoe UI Symbol', FONT_SIZE, False, cache)
+    title_font, hit_title = cached_sys_font('Arial', 30, True, cache)
+    small_font, hit_small = cached_sys_font('Segoe UI Symbol', 16, False, cache)
+    fonts_from_cache = hit_font and hit_title and hit_small
+    if not fonts_from_cache:
+        save_font_cache(cache)
+
+def init_display():
+    global screen
+    # Only the modules we use; pygame.init() would also start audio, joysticks, ...
+    pygame.display.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("SHA-256 Algorithm Visualization")
+    load_fonts()
+    return screen
+
+# SHA-256 constants
+K_VALUES = array('I', [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+])
+
+# Initial hash values (first 32 bits of the fractional parts of the square roots of the first 8 primes)
+H_VALUES = array('I', [
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+])
+
+STATE_LABELS = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+
+def right_rotate(value, amount):
+    return ((value >> amount) | (value << (32 - amount))) & 0xFFFFFFFF
+
+def ch(x, y, z):
+    return (x & y) ^ (~x & z)
+
+def maj(x, y, z):
+    return (x & y) ^ (x & z) ^ (y & z)
+
+def big_sigma0(x):
+    return right_rotate(x, 2) ^ right_rotate(x, 13) ^ right_rotate(x, 22)
+
+def big_sigma1(x):
+    return right_rotate(x, 6) ^ right_rotate(x, 11) ^ right_rotate(x, 25)
+
+def small_sigma0(x):
+    return right_rotate(x, 7) ^ right_rotate(x, 18) ^ (x >> 3)
+
+def small_sigma1(x):
+    return right_rotate(x, 17) ^ right_rotate(x, 19) ^ (x >> 10)
+
+def pad_message(data):
+    # data + bit '1' + '0' padding + 64-bit length, as bytes
+    length = len(data) * 8
+    return bytes(data) + b'\x80' + b'\x00' * ((55 - len(data)) % 64) + length.to_bytes(8, 'big')
+
+def pad_tail(tail, length):
+    # Padded last block(s) of a message of length bytes that ends with tail
+    return pad_message(tail)[:-8] + (length * 8).to_bytes(8, 'big')
+
+def byte_label(value):
+    # Step 1 shows printable ASCII as the character, every other byte (e.g. UTF-8) in hex
+    return f"'{chr(value)}'" if 32 <= value < 127 else f"0x{value:02x}"
+
+def bit_string(data, start, stop):
+    # '0'/'1' characters for bits [start, stop) of data, built only when displayed
+    first = start // 8
+    bits = ''.join(format(byte, '08b') for byte in data[first:(stop + 7) // 8])
+    offset = start - first * 8
+    return bits[offset:offset + stop - start]
+
+def bit_preview(data, bit_count, edge=35):
+    if bit_count > 2 * edge:
+        return bit_string(data, 0, edge) + "..." + bit_string(data, bit_count - edge, bit_count)
+    return bit_string(data, 0, bit_count)
+
+def message_schedule(block):
+    # block: 64 bytes -> W[0..63]
+    w = array('I', struct.unpack('>16I', block))
+    for i in range(16, 64):
+        w.append((small_sigma1(w[i - 2]) + w[i - 7] + small_sigma0(w[i - 15]) + w[i - 16]) & 0xFFFFFFFF)
+    return w
+
+def compress(state, w, rounds=None):
+    # 64 rounds over schedule w; the state after each round is appended to rounds if given
+    a, b, c, d, e, f, g, h = state
+    for i in range(64):
+        T1 = (h + big_sigma1(e) + ch(e, f, g) + K_VALUES[i] + w[i]) & 0xFFFFFFFF
+        T2 = (big_sigma0(a) + maj(a, b, c)) & 0xFFFFFFFF
+        h = g
+        g = f
+        f = e
+        e = (d + T1) & 0xFFFFFFFF
+        d = c
+        c = b
+        b = a
+        a = (T1 + T2) & 0xFFFFFFFF
+        if rounds is not None:
+            rounds.extend((a, b, c, d, e, f, g, h))
+    return array('I', ((x + y) & 0xFFFFFFFF for x, y in zip(state, (a, b, c, d, e, f, g, h))))
+
+class BlockTrace:
+    # W schedule and the a..h state after every round of one 512-bit block
+    __slots__ = ('index', 'h_in', 'w', 'rounds', 'h_out')
+
+    def __init__(self, index, h_in, block):
+        self.index = index
+        self.h_in = array('I', h_in)
+        self.w = message_schedule(block)
+        self.rounds = array('I')
+        self.h_out = compress(self.h_in, self.w, self.rounds)
+
+    @classmethod
+    def from_words(cls, index, h_in, w, rounds, h_out):
+        # Wraps words that are already known (e.g. views into a trace file) without recompressing
+        trace = cls.__new__(cls)
+        trace.index = index
+        trace.h_in = h_in
+        trace.w = w
+        trace.rounds = rounds
+        trace.h_out = h_out
+        return trace
+
+    def state_after(self, i):
+        return self.rounds[i * 8:(i + 1) * 8]
+
+    def state_before(self, i):
+        if i == 0:
+            return self.h_in
+        return self.state_after(i - 1)
+
+    def round_terms(self, i):
+        # Intermediate values of round i, computed from the state entering the round
+        a, b, c, d, e, f, g, h = self.state_before(i)
+        ch_result = ch(e, f, g)
+        maj_result = maj(a, b, c)
+        sigma0_result = big_sigma0(a)
+        sigma1_result = big_sigma1(e)
+        T1 = (h + sigma1_result + ch_result + K_VALUES[i] + self.w[i]) & 0xFFFFFFFF
+        T2 = (sigma0_result + maj_result) & 0xFFFFFFFF
+        return ch_result, maj_result, sigma0_result, sigma1_result, T1, T2
+
+class MessageTrace:
+    # Chaining values for every block of a padded message; the per-round
+    # BlockTrace of a block is only built when it is looked up
+    def __init__(self, padded, cache_size=8, compute=True):
+        self.padded = memoryview(padded)
+        self.block_count = len(padded) // 64
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.midstates = array('I', H_VALUES)
+        self.ready_blocks = 0
+        if compute:
+            for _ in self.compute_midstates():
+                pass
+
+    def compute_midstates(self, chunk_blocks=64):
+        # Chains the compression chunk by chunk, yielding the number of blocks done so far;
+        # midstate(i) can be used as soon as i <= ready_blocks
+        state = self.midstate(self.ready_blocks)
+        while self.ready_blocks < self.block_count:
+            end = min(self.ready_blocks + chunk_blocks, self.block_count)
+            for i in range(self.ready_blocks, end):
+                state = compress(state, message_schedule(self.block(i)))
+                self.midstates.extend(state)
+            self.ready_blocks = end
+            yield end
+
+    def is_ready(self, i):
+        return i < self.ready_blocks
+
+    def resume_from(self, midstates):
+        # Reuse already known midstates (8 words per finished block, starting with H_VALUES)
+        blocks = min(len(midstates) // 8 - 1, self.block_count)
+        self.midstates = array('I', midstates[:(blocks + 1) * 8])
+        self.ready_blocks = blocks
+
+    def message(self):
+        # The unpadded message, from the 64-bit length field
+        length = int.from_bytes(self.padded[-8:], 'big') // 8
+        return self.padded[:length]
+
+    def __len__(self):
+        return self.block_count
+
+    def block(self, i):
+        return self.padded[i * 64:(i + 1) * 64]
+
+    def midstate(self, i):
+        # Hash state entering block i (i == block_count gives the final state)
+        return self.midstates[i * 8:(i + 1) * 8]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.block_count
+        if not 0 <= i < self.block_count:
+            raise IndexError(i)
+        trace = self.cache.get(i)
+        if trace is None:
+            trace = self.cache[i] = BlockTrace(i, self.midstate(i), self.block(i))
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(i)
+        return trace
+
+    def hexdigest(self):
+        return ''.join(f"{value:08x}" for value in self.midstate(self.block_count))
+
+class TraceJob:
+    # Fills a MessageTrace on a worker thread so long inputs don't freeze the window
+    def __init__(self, trace):
+        self.trace = trace
+        self.final_hash = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        self.final_hash = sha256(self.trace.message()).hexdigest()
+        for _ in self.trace.compute_midstates():
+            if self.cancelled.is_set():
+                return
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def finished(self):
+        return not self.thread.is_alive() and not self.cancelled.is_set()
+
+    def progress(self):
+        return self.trace.ready_blocks / max(1, self.trace.block_count)
+
+# Proof of work: the nonce is appended to the message as 8 big-endian bytes
+NONCE_BYTES = 8
+
+def mining_target(bits):
+    # Digests below this (compared as bytes) start with at least bits zero bits
+    return (1 << (256 - bits)).to_bytes(32, 'big')
+
+def playback_speed(text):
+    # argparse type for --speed: clamped like + / - in the window, so export timings match it
+    speed = float(text)
+    if not speed > 0:
+        raise argparse.ArgumentTypeError(f"speed must be positive, not {text}")
+    return min(max(speed, PlaybackClock.SPEEDS[0]), PlaybackClock.SPEEDS[-1])
+
+def mining_bits(text):
+    # argparse type for --mine: 0 would need no work and more than 256 has no target
+    bits = int(text)
+    if not 1 <= bits <= 256:
+        raise argparse.ArgumentTypeError(f"BITS must be between 1 and 256, not {bits}")
+    return bits
+
+def mine_worker_init(prefix, target, double):
+    global mine_state
+    # hashlib's state after the prefix: its full blocks are compressed once per worker,
+    # every attempt copies that midstate and only hashes the tail with the nonce
+    mine_state = (sha256(prefix), target, double)
+
+def mine_range(start, count):
+    # Returns (winning nonce or None, attempts made)
+    prefix_hash, target, double = mine_state
+    for nonce in range(start, start + count):
+        attempt = prefix_hash.copy()
+        attempt.update(nonce.to_bytes(NONCE_BYTES, 'big'))
+        digest = attempt.digest()
+        if double:
+            digest = sha256(digest).digest()
+        if digest < target:
+            return nonce, nonce - start + 1
+    return None, count
+
+class Miner:
+    # Searches for a nonce so that SHA-256(prefix || nonce), or SHA-256 of that digest, starts
+    # with bits zero bits. Ranges of CHUNK nonces are handed out to one process per core.
+    CHUNK = 1 << 16
+
+    def __init__(self, prefix, bits, double=False, jobs=None):
+        self.prefix = bytes(prefix)
+        self.bits = bits
+        self.double = double
+        self.jobs = jobs or os.cpu_count() or 1
+        self.attempts = 0
+        self.nonce = None
+        self.digest = None
+        self.elapsed = 0.0
+        self.started = time.perf_counter()
+        self.cancelled = threading.Event()
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.jobs, initializer=mine_worker_init,
+            initargs=(self.prefix, mining_target(bits), double))
+        # The first ranges are submitted here, so the workers are started from the calling thread
+        self.next_nonce = 0
+        self.pending = set()
+        self.fill()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        while len(self.pending) < 2 * self.jobs:
+            self.pending.add(self.pool.submit(mine_range, self.next_nonce, self.CHUNK))
+            self.next_nonce += self.CHUNK
+
+    def run(self):
+        while self.nonce is None and not self.cancelled.is_set():
+            finished, self.pending = concurrent.futures.wait(self.pending, timeout=0.1,
+                                                             return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                nonce, attempts = future.result()
+                self.attempts += attempts
+                if nonce is not None and (self.nonce is None or nonce < self.nonce):
+                    self.nonce = nonce
+            if self.nonce is None and not self.cancelled.is_set():
+                self.fill()
+            self.elapsed = time.perf_counter() - self.started
+        if self.nonce is not None:
+            self.digest = self.hash(self.message()).hex()
+        # Waits for the chunks already running, so the workers are gone before the interpreter exits
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def hash(self, data):
+        digest = sha256(data).digest()
+        return sha256(digest).digest() if self.double else digest
+
+    def message(self):
+        return self.prefix + self.nonce.to_bytes(NONCE_BYTES, 'big')
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def hashrate(self):
+        return self.attempts / self.elapsed if self.elapsed else 0.0
+
+    def blocks(self):
+        # (prefix blocks reused from the midstate, blocks compressed per attempt)
+        reused = len(self.prefix) // 64
+        tail = len(pad_message(bytes(len(self.prefix) % 64 + NONCE_BYTES))) // 64
+        return reused, tail + int(self.double)
+
+# Trace file: header | padded blocks | midstates | per block W[64] + a..h after each round [64 * 8].
+# Words are little-endian uint32, so a mapped file is used as is on little-endian hosts.
+TRACE_MAGIC = b'SHA256TR'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<8sIIQ8x')  # magic, version, block count, message length
+TRACE_RECORD_WORDS = 64 + 64 * 8
+
+def le_bytes(words):
+    words = array('I', words)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tobytes()
+
+def le_words(view):
+    # Zero-copy uint32 view of little-endian file data where the host allows it
+    if sys.byteorder == 'little':
+        return view.cast('I')
+    words = array('I')
+    words.frombytes(view)
+    words.byteswap()
+    return words
+
+def save_trace(trace, path, chunk_blocks=4096):
+    for _ in trace.compute_midstates():
+        pass
+    with open(path, 'wb') as f:
+        f.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(trace), len(trace.message())))
+        f.write(trace.padded)
+        f.write(le_bytes(trace.midstates))
+        if np is None:
+            for i in range(len(trace)):
+                block = BlockTrace(i, trace.midstate(i), trace.block(i))
+                f.write(le_bytes(block.w) + le_bytes(block.rounds))
+            return
+        # With every midstate known the blocks are independent, so NumPy does them in batches
+        midstates = np.frombuffer(trace.midstates, dtype=np.uint32).reshape(-1, 8)
+        words = np.frombuffer(trace.padded, dtype='>u4').reshape(-1, 16).astype(np.uint32)
+        for start in range(0, len(trace), chunk_blocks):
+            end = min(start + chunk_blocks, len(trace))
+            w, rounds = np_compress(midstates[start:end], words[start:end])
+            records = np.concatenate([w, rounds.reshape(end - start, 64 * 8)], axis=1)
+            f.write(records.astype('<u4').tobytes())
+
+class MappedTrace(MessageTrace):
+    # A trace written by save_trace, opened with mmap. Blocks, midstates and round states are
+    # views into the file, so nothing is parsed and only the pages of the blocks shown are read.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        if len(view) < TRACE_HEADER.size:
+            raise ValueError(f"{path} is not a SHA-256 trace file")
+        magic, version, block_count, length = TRACE_HEADER.unpack_from(view)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{path} is not a SHA-256 trace file")
+        midstates_at = TRACE_HEADER.size + block_count * 64
+        records_at = midstates_at + (block_count + 1) * 32
+        if len(view) != records_at + block_count * TRACE_RECORD_WORDS * 4:
+            raise ValueError(f"{path} is truncated or corrupt")
+        self.padded = view[TRACE_HEADER.size:midstates_at]
+        self.block_count = block_count
+        self.midstates = le_words(view[midstates_at:records_at])
+        self.records = le_words(view[records_at:])
+        self.ready_blocks = block_count
+
+    def compute_midstates(self, chunk_blocks=64):
+        return iter(())
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.block_count
+        if not 0 <= i < self.block_count:
+            raise IndexError(i)
+        record = self.records[i * TRACE_RECORD_WORDS:(i + 1) * TRACE_RECORD_WORDS]
+        return BlockTrace.from_words(i, self.midstate(i), record[:64], record[64:], self.midstate(i + 1))
+
+class PaddedFile:
+    # File data followed by its padding, sliced like bytes without copying the file
+    def __init__(self, data, tail):
+        self.data = data
+        self.tail = tail
+
+    def __len__(self):
+        return len(self.data) // 64 * 64 + len(self.tail)
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        split = len(self.data) // 64 * 64
+        head = bytes(self.data[start:min(stop, split)]) if start < split else b""
+        return head + self.tail[max(start - split, 0):max(stop - split, 0)]
+
+class FileTrace(MessageTrace):
+    # A file hashed straight from mmap, in constant memory: only the midstate entering every
+    # checkpoint_blocks-th block is kept (32 bytes per 16 KB of file) and other midstates are
+    # recompressed from the checkpoint before them when their block is looked at.
+    def __init__(self, path, checkpoint_blocks=256, cache_size=8):
+        with open(path, 'rb') as f:
+            self.length = os.fstat(f.fileno()).st_size
+            # mmap refuses empty files
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.length else None
+        if self.map is not None and hasattr(self.map, 'madvise'):
+            # Read once front to back: let the kernel drop pages behind the hashing
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.data = memoryview(self.map) if self.map is not None else memoryview(b"")
+        self.full_blocks = self.length // 64
+        self.tail = pad_tail(bytes(self.data[self.full_blocks * 64:]), self.length)
+        self.padded = PaddedFile(self.data, self.tail)
+        self.block_count = self.full_blocks + len(self.tail) // 64
+        self.checkpoint_blocks = checkpoint_blocks
+        self.checkpoints = array('I', H_VALUES)
+        self.final_state = None
+        self.segment = None
+        self.midstates = None
+        self.ready_blocks = 0
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def compute_midstates(self, chunk_blocks=256):
+        state = self.checkpoints[-8:]
+        while self.ready_blocks < self.block_count:
+            end = min(self.ready_blocks + chunk_blocks, self.block_count)
+            for i in range(self.ready_blocks, end):
+                state = compress(state, message_schedule(self.block(i)))
+                if (i + 1) % self.checkpoint_blocks == 0:
+                    self.checkpoints.extend(state)
+            if end == self.block_count:
+                self.final_state = state
+            self.ready_blocks = end
+            yield end
+
+    def message(self):
+        return self.data
+
+    def block(self, i):
+        if i < self.full_blocks:
+            return self.data[i * 64:(i + 1) * 64]
+        i -= self.full_blocks
+        return self.tail[i * 64:(i + 1) * 64]
+
+    def midstate(self, i):
+        if i == self.block_count:
+            return self.final_state
+        first, offset = divmod(i, self.checkpoint_blocks)
+        if self.segment is None or self.segment[0] != first or len(self.segment[1]) <= offset * 8:
+            # Midstates of the whole segment, so stepping through its blocks costs nothing more
+            start = first * self.checkpoint_blocks
+            end = min(start + self.checkpoint_blocks, self.ready_blocks)
+            state = self.checkpoints[first * 8:(first + 1) * 8]
+            midstates = array('I', state)
+            for j in range(start, end - 1):
+                state = compress(state, message_schedule(self.block(j)))
+                midstates.extend(state)
+            self.segment = (first, midstates)
+        return self.segment[1][offset * 8:(offset + 1) * 8]
+
+class LiveHasher:
+    # SHA-256 of the text being typed. The midstate after every complete 64-byte block
+    # is kept, so a keystroke only recompresses the blocks it changed plus the padded tail.
+    # A long paste is spread over several calls of max_blocks blocks; digest is None until done.
+    def __init__(self):
+        self.data = b""
+        self.midstates = array('I', H_VALUES)
+        self.digest = sha256(b"").hexdigest()
+        self.block_count = 1
+
+    def common_prefix(self, data):
+        old = self.data
+        if data.startswith(old):
+            return len(old)
+        if old.startswith(data):
+            return len(data)
+        low, high = 0, min(len(old), len(data))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if old[:middle] == data[:middle]:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def ready_blocks(self):
+        return len(self.midstates) // 8 - 1
+
+    def update(self, data, max_blocks=None):
+        if data == self.data and self.digest is not None:
+            return
+        if data != self.data:
+            # Roll back to the last block both versions share
+            keep = self.common_prefix(data) // 64
+            del self.midstates[(keep + 1) * 8:]
+            self.data = data
+            self.digest = None
+
+        full = len(data) // 64
+        self.block_count = (len(data) + 8) // 64 + 1
+        start = self.ready_blocks()
+        stop = full if max_blocks is None else min(full, start + max_blocks)
+        state = self.midstates[-8:]
+        for i in range(start, stop):
+            state = compress(state, message_schedule(data[i * 64:(i + 1) * 64]))
+            self.midstates.extend(state)
+        if stop < full:
+            return
+
+        tail = pad_tail(data[full * 64:], len(data))
+        for i in range(0, len(tail), 64):
+            state = compress(state, message_schedule(tail[i:i + 64]))
+        self.digest = ''.join(f"{value:08x}" for value in state)
+
+def np_rotr(x, amount):
+    return (x >> np.uint32(amount)) | (x << np.uint32(32 - amount))
+
+def np_compress(state, words):
+    # One block for a whole batch: state (N, 8), words (N, 16) -> w (N, 64), rounds (N, 64, 8)
+    count = len(state)
+    k_values = np.array(K_VALUES, dtype=np.uint32)
+    # One row per word / round, so every operation runs on a contiguous batch
+    w = np.empty((64, count), dtype=np.uint32)
+    w[:16] = words.T
+    for i in range(16, 64):
+        x = w[i - 15]
+        y = w[i - 2]
+        sigma0 = np_rotr(x, 7) ^ np_rotr(x, 18) ^ (x >> np.uint32(3))
+        sigma1 = np_rotr(y, 17) ^ np_rotr(y, 19) ^ (y >> np.uint32(10))
+        w[i] = sigma1 + w[i - 7] + sigma0 + w[i - 16]
+
+    rounds = np.empty((64, 8, count), dtype=np.uint32)
+    a, b, c, d, e, f, g, h = state.T.copy()
+    for i in range(64):
+        S1 = np_rotr(e, 6) ^ np_rotr(e, 11) ^ np_rotr(e, 25)
+        T1 = h + S1 + ((e & f) ^ (~e & g)) + k_values[i] + w[i]
+        S0 = np_rotr(a, 2) ^ np_rotr(a, 13) ^ np_rotr(a, 22)
+        T2 = S0 + ((a & b) ^ (a & c) ^ (b & c))
+        h = g
+        g = f
+        f = e
+        e = d + T1
+        d = c
+        c = b
+        b = a
+        a = T1 + T2
+        rounds[i] = (a, b, c, d, e, f, g, h)
+    return w.T, rounds.transpose(2, 0, 1)
+
+class BatchTrace:
+    # W schedules and per-round a..h states of many messages, computed in lockstep with NumPy.
+    # w: (N, blocks, 64), rounds: (N, blocks, 64, 8), midstates: (N, blocks + 1, 8), all uint32;
+    # entries past block_counts[n] belong to zero blocks and are not part of message n
+    def __init__(self, messages):
+        if np is None:
+            raise RuntimeError("the batch engine needs NumPy (pip install numpy)")
+        padded = [pad_message(message) for message in messages]
+        count = len(padded)
+        self.block_counts = np.array([len(p) // 64 for p in padded], dtype=np.int64)
+        blocks = int(self.block_counts.max()) if count else 0
+        words = np.frombuffer(b''.join(p.ljust(blocks * 64, b'\x00') for p in padded), dtype='>u4')
+        words = words.reshape(count, blocks, 16).astype(np.uint32)
+
+        self.w = np.empty((count, blocks, 64), dtype=np.uint32)
+        self.rounds = np.empty((count, blocks, 64, 8), dtype=np.uint32)
+        self.midstates = np.empty((count, blocks + 1, 8), dtype=np.uint32)
+        state = np.tile(np.array(H_VALUES, dtype=np.uint32), (count, 1))
+        self.midstates[:, 0] = state
+
+        for index in range(blocks):
+            self.w[:, index], self.rounds[:, index] = np_compress(state, words[:, index])
+            active = (self.block_counts > index)[:, None]
+            state = np.where(active, state + self.rounds[:, index, 63], state)
+            self.midstates[:, index + 1] = state
+
+        self.digests = state
+
+    def __len__(self):
+        return len(self.block_counts)
+
+    def hexdigest(self, n):
+        return self.digests[n].astype('>u4').tobytes().hex()
+
+    def verify(self, messages):
+        return all(self.hexdigest(n) == sha256(message).hexdigest() for n, message in enumerate(messages))
+
+class AvalancheTrace:
+    # Every single-bit flip of the message bits inside one block, compressed as one NumPy batch
+    # from that block's midstate and XORed against the unflipped trace.
+    # flip_rate: (64, 256) fraction of variants in which each a..h state bit differs after each round
+    # output_bits: bits changed in the block's chaining value, which is the digest only for the last block
+    def __init__(self, trace, index, message_length):
+        if np is None:
+            raise RuntimeError("avalanche mode needs NumPy (pip install numpy)")
+        start = index * 64
+        flips = 8 * max(0, min(message_length - start, 64))
+        self.index = index
+        self.flips = flips
+        self.final = index == len(trace) - 1
+        self.surface = None
+        base = trace[index]
+        base_rounds = np.array(base.rounds, dtype=np.uint32).reshape(64, 8)
+        base_output = np.array(base.h_out, dtype=np.uint32)
+        if flips == 0:
+            self.flip_rate = np.zeros((64, 256))
+            self.output_bits = np.zeros(0, dtype=np.int64)
+            return
+
+        # Bit k of the block is bit 7 - k % 8 of byte k // 8, stored big-endian in word k // 32
+        bits = np.arange(flips)
+        words = np.tile(np.frombuffer(trace.block(index), dtype='>u4').astype(np.uint32), (flips, 1))
+        words[bits, bits // 32] ^= (np.uint32(1) << (31 - bits % 32).astype(np.uint32))
+        state = np.tile(np.array(base.h_in, dtype=np.uint32), (flips, 1))
+        _, rounds = np_compress(state, words)
+
+        changed = np.unpackbits((rounds ^ base_rounds).astype('>u4', order='C').view(np.uint8).reshape(flips, 64, 32), axis=2)
+        self.flip_rate = changed.mean(axis=0)
+        outputs = rounds[:, 63] + state
+        self.output_bits = np.unpackbits((outputs ^ base_output).astype('>u4', order='C').view(np.uint8), axis=1).sum(axis=1)
+
+    def round_bits(self, i):
+        # Average number of state bits that differ after round i
+        return float(self.flip_rate[i].sum())
+
+    def heatmap(self, size):
+        # White = never differs, blue = differs half the time (ideal), red = always differs
+        if self.surface is None or self.surface.get_size() != size:
+            rate = self.flip_rate.T
+            half = np.minimum(rate, 0.5) * 2
+            over = np.maximum(rate - 0.5, 0) * 2
+            rgb = np.empty(rate.shape + (3,), dtype=np.uint8)
+            rgb[..., 0] = 255 * (1 - half) + 255 * over
+            rgb[..., 1] = 255 * (1 - half)
+            rgb[..., 2] = 255 * (1 - over)
+            # surfarray is indexed (x, y): x = round, y = state bit
+            grid = pygame.surfarray.make_surface(rgb.transpose(1, 0, 2))
+            self.surface = pygame.transform.scale(grid, size)
+        return self.surface
+
+# Bit colours: 0, 1, a bit that just became 0, a bit that just became 1
+BIT_COLORS = [WHITE, (40, 40, 160), (255, 190, 190), RED]
+
+def bit_grid(words, before, size):
+    # words: 64 columns (W indexes or rounds) of n uint32 words each, drawn as one pixel per bit
+    # with x = column and y = bit, then scaled to size. A bit counts as changed when it differs
+    # from the same bit one column to the left; before is what precedes the first column.
+    words = np.asarray(words, dtype=np.uint32).reshape(64, -1)
+    previous = np.vstack([np.asarray(before, dtype=np.uint32).reshape(1, -1), words[:-1]])
+    bits = np.unpackbits(words.astype('>u4').view(np.uint8).reshape(64, -1), axis=1)
+    changed = np.unpackbits((words ^ previous).astype('>u4').view(np.uint8).reshape(64, -1), axis=1)
+    rgb = np.array(BIT_COLORS, dtype=np.uint8)[bits + 2 * changed]
+    return pygame.transform.scale(pygame.surfarray.make_surface(rgb), size)
+
+# Bảng ký tự cho chuỗi hex / binary được vẽ bằng glyph atlas
+DIGIT_ALPHABET = "0123456789abcdef."
+
+class GlyphAtlas:
+    def __init__(self, font, color, alphabet=DIGIT_ALPHABET):
+        self.glyphs = {c: font.render(c, True, color) for c in alphabet}
+        self.advances = {c: glyph.get_width() for c, glyph in self.glyphs.items()}
+        self.height = font.get_linesize()
+
+    def draw(self, screen, text, pos):
+        x, y = pos
+        glyphs = self.glyphs
+        advances = self.advances
+        sequence = []
+        for c in text:
+            sequence.append((glyphs[c], (x, y)))
+            x += advances[c]
+        screen.blits(sequence, doreturn=False)
+        return pygame.Rect(pos[0], y, x - pos[0], self.height)
+
+class TextCache:
+    # LRU cache of rendered text surfaces, bounded by surface memory
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.surfaces = OrderedDict()
+        self.atlases = {}
+
+    def render(self, font, text, color):
+        key = (font, text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = font.render(text, True, color)
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        self.surfaces[key] = surface
+        self.used_bytes += size
+        while self.used_bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, old = self.surfaces.popitem(last=False)
+            self.used_bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+        return surface
+
+    def draw(self, screen, font, text, color, pos):
+        surface = self.render(font, text, color)
+        screen.blit(surface, pos)
+        return surface.get_rect(topleft=pos)
+
+    def atlas(self, font, color):
+        key = (font, tuple(color))
+        atlas = self.atlases.get(key)
+        if atlas is None:
+            atlas = self.atlases[key] = GlyphAtlas(font, color)
+        return atlas
+
+    def draw_digits(self, screen, font, text, color, pos):
+        return self.atlas(font, color).draw(screen, text, pos)
+
+    def clear(self):
+        self.surfaces.clear()
+        self.atlases.clear()
+        self.used_bytes = 0
+
+text_cache = TextCache()
+
+class FrameCache:
+    # LRU cache of fully composed frames, so going back to a state already seen is one blit.
+    # A 1200x800 frame is ~3.7 MB; the default holds the 64 rounds of a block.
+    # Storing a frame costs a full copy (~0.9 ms) and a plain step redraws in well under a ms,
+    # so only frames that took at least min_draw_seconds to draw are kept (the bit grid view).
+    def __init__(self, max_bytes=256 * 1024 * 1024, min_draw_seconds=0.002):
+        self.max_bytes = max_bytes
+        self.min_draw_seconds = min_draw_seconds
+        self.used_bytes = 0
+        self.frames = OrderedDict()
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+        return frame
+
+    def put(self, key, surface):
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        if key in self.frames or size > self.max_bytes:
+            return
+        self.frames[key] = surface.copy()
+        self.used_bytes += size
+        while self.used_bytes > self.max_bytes:
+            _, old = self.frames.popitem(last=False)
+            self.used_bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+
+    def clear(self):
+        self.frames.clear()
+        self.used_bytes = 0
 
 class BinaryConverter:
-    def __init__(self, x, y):
+    def __init__(self, x, y, clock):
         self.x = x
         self.y = y
         self.current_char = ""
@@ -35,73 +935,165 @@ class BinaryConverter:
         self.show_conversion = False
         self.animation_step = 0
         self.last_update = 0
+        self.clock = clock
         
-    def start_conversion(self, char):
-        self.current_char = char
-        self.current_ascii = ord(char)
+    def start_conversion(self, value):
+        # value: one byte of the UTF-8 message
+        self.current_char = byte_label(value)
+        self.current_ascii = value
         self.current_binary = format(self.current_ascii, '08b')
         self.show_conversion = True
         self.animation_step = 0
-        self.last_update = time.time()
+        self.last_update = self.clock()
         
     def update(self):
         if not self.show_conversion:
             return
             
-        current_time = time.time()
+        current_time = self.clock()
         if current_time - self.last_update > 0.2:  
             self.animation_step += 1
             self.last_update = current_time
             
         if self.animation_step > 10:
             self.show_conversion = False
+
+    def next_tick(self):
+        # Time of the next animation step, None when idle
+        if not self.show_conversion:
+            return None
+        return self.last_update + 0.2
+
+    def area(self):
+        # Vùng màn hình mà animation chuyển đổi có thể vẽ lên
+        return pygame.Rect(0, self.y - 35, WIDTH, 265)
             
     def draw(self, screen):
         if not self.show_conversion:
             return
-        char_text = font.render(f"Character: '{self.current_char}'", True, BLACK)
-        screen.blit(char_text, (self.x, self.y - 30))
+        ascii = self.current_ascii < 128
+        text_cache.draw(screen, font, f"{'Character' if ascii else 'Byte'}: {self.current_char}", BLACK, (self.x, self.y - 30))
         
         if self.animation_step >= 1:
-            ascii_text = font.render(f"ASCII: {self.current_ascii}", True, BLUE)
-            screen.blit(ascii_text, (self.x + 200, self.y - 30))
+            text_cache.draw(screen, font, f"{'ASCII' if ascii else 'Value'}: {self.current_ascii}", BLUE, (self.x + 200, self.y - 30))
         
         if self.animation_step >= 2:
             binary_y = self.y + 10
-            title = font.render("Binary conversion:", True, BLACK)
-            screen.blit(title, (self.x, binary_y))
+            text_cache.draw(screen, font, "Binary conversion:", BLACK, (self.x, binary_y))
 
             step_y = binary_y + 30
             ascii_num = self.current_ascii
             for i in range(8):
                 if self.animation_step >= i + 2:
                     bit = (ascii_num >> (7-i)) & 1
-                    step_text = small_font.render(f"Step {i+1}: {ascii_num} ÷ 2 = {ascii_num//2} remainder {bit}", True, BLUE)
-                    screen.blit(step_text, (self.x + 20, step_y + i*20))
+                    text_cache.draw(screen, small_font, f"Step {i+1}: {ascii_num} ÷ 2 = {ascii_num//2} remainder {bit}", BLUE, (self.x + 20, step_y + i*20))
                     ascii_num = ascii_num // 2
             
             if self.animation_step >= 10:
-                result_text = font.render(f"Final binary: {self.current_binary}", True, GREEN)
-                screen.blit(result_text, (self.x, step_y + 160))
+                text_cache.draw(screen, font, f"Final binary: {self.current_binary}", GREEN, (self.x, step_y + 160))
+
+class ScrollList:
+    # Danh sách ảo: chỉ vẽ các dòng nằm trong rect, chi phí không phụ thuộc độ dài danh sách.
+    # Items fill each column top to bottom; with several columns it scrolls a column at a time.
+    def __init__(self, rect, row_height, columns=1, column_width=0, follow=True):
+        self.rect = pygame.Rect(rect)
+        self.row_height = row_height
+        self.columns = columns
+        self.column_width = column_width
+        self.rows = max(1, self.rect.h // row_height)
+        self.step = self.rows if columns > 1 else 1
+        self.wheel_lines = 1 if columns > 1 else 3
+        self.initial_follow = follow
+        self.count = 0
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        # While following, the view sticks to the newest items as the list grows
+        self.follow = self.initial_follow
+
+    def page(self):
+        return self.rows * self.columns
+
+    def max_offset(self):
+        hidden = self.count - self.page()
+        return max(0, -(-hidden // self.step) * self.step)
+
+    def set_count(self, count):
+        self.count = count
+        self.offset = self.max_offset() if self.follow else min(self.offset, self.max_offset())
+
+    def scroll(self, lines):
+        self.offset = max(0, min(self.offset + lines * self.step, self.max_offset()))
+        self.follow = self.offset == self.max_offset()
+
+    def handle_key(self, key):
+        lines = self.page() // self.step
+        if key == pygame.K_PAGEUP:
+            self.scroll(-lines)
+        elif key == pygame.K_PAGEDOWN:
+            self.scroll(lines)
+        elif key == pygame.K_HOME:
+            self.scroll(-self.count)
+        elif key == pygame.K_END:
+            self.scroll(self.count)
+        else:
+            return False
+        return True
+
+    def handle_wheel(self, dy):
+        self.scroll(-dy * self.wheel_lines)
+
+    def visible(self):
+        return range(self.offset, min(self.count, self.offset + self.page()))
+
+    def position(self, index):
+        slot = index - self.offset
+        return (self.rect.x + slot // self.rows * self.column_width,
+                self.rect.y + slot % self.rows * self.row_height)
+
+    def draw(self, screen, draw_item):
+        for index in self.visible():
+            draw_item(index, self.position(index))
+        if self.count > self.page():
+            track = pygame.Rect(self.rect.right - 4, self.rect.y, 4, self.rect.h)
+            thumb_h = max(12, track.h * self.page() // self.count)
+            thumb_y = track.y + (track.h - thumb_h) * self.offset // max(1, self.max_offset())
+            pygame.draw.rect(screen, LIGHT_BLUE, track)
+            pygame.draw.rect(screen, BLUE, (track.x, thumb_y, track.w, thumb_h))
+
+# Messages with more blocks than this are traced on a worker thread
+BACKGROUND_TRACE_BLOCKS = 256
+PROGRESS_RECT = pygame.Rect(WIDTH - 330, 50, 320, 40)
+# Avalanche heatmap: 64 rounds across, the 256 bits of a..h down
+AVALANCHE_RECT = pygame.Rect(80, 160, 1024, 512)
+# Bit grids (key B) sit in the same place, so round columns line up when switching views
+BIT_GRID_RECT = AVALANCHE_RECT
 
 class SHA256Visualizer:
-    def __init__(self):
+    # clock: animation time source, PlaybackClock() (real time) unless given
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else PlaybackClock()
         self.message = ""
         self.current_step = 0
         self.total_steps = 6
-        self.binary_message = ""
-        self.padded_message = ""
-        self.blocks = []
+        self.message_bytes = b""
+        self.padded_message = b""
+        self.traces = MessageTrace(pad_message(b""))
+        self.job = None
+        self.live = LiveHasher()
+        self.current_block = 0
         self.final_hash = ""
-        self.binary_converter = BinaryConverter(50, 150)
+        self.binary_converter = BinaryConverter(50, 150, self.clock)
         self.current_char_index = 0
         self.conversion_complete = False
-        self.binary_result = []
-        self.w_values = [0] * 64
+        self.converted_chars = 0
         self.current_w = 0
         self.calculation_h = 0
-        self.scroll_offset = 0
-        self.k_scroll_offset = 0
+        self.char_list = ScrollList((70, 400, 900, 375), 25, columns=5, column_width=180)
+        self.block_list = ScrollList((50, 380, 1100, 400), 25, follow=False)
+        self.w_list = ScrollList((50, 165, 330, 480), 30)
+        self.k_list = ScrollList((950, 165, 240, 480), 30)
         self.last_w_update = 0
         self.w_update_delay = 0.2
         self.final_step5 = False
@@ -110,314 +1102,840 @@ class SHA256Visualizer:
         self.color = pygame.Color('dodgerblue2')
         self.button_color = pygame.Color('lightgreen')
         self.text = self.message
+        self.last_frame = None
+        self.last_layout = None
+        self.canvas = None
+        # The surface the screen was last copied from: the canvas, or a cached frame
+        self.shown = None
+        self.frame_cache = FrameCache()
+        self.timeline_rect = pygame.Rect(50, HEIGHT - 10, WIDTH - 100, 6)
+        self.scrubbing = False
+        self.goto_text = None
+        self.show_avalanche = False
+        self.avalanche = OrderedDict()
+        self.show_bits = False
+        # Bit grids and avalanche heatmaps are ~2 MB each, so only the last few blocks shown are kept
+        self.view_cache_size = 8
+        self.bit_grids = OrderedDict()
+        self.miner = None
+        self.mine_bits = 20
+        self.mine_double = False
+        self.mine_jobs = None
         
-    def update_message(self, msg):
+    def update_message(self, msg, trace=None):
         self.message = msg
         self.current_step = 0
-        self.binary_message = ""
         self.current_char_index = 0
         self.conversion_complete = False
-        self.binary_result = []
-        if len(msg) > 0:
-            self.binary_converter.start_conversion(msg[0])
-        
-        msg_len_bits = len(msg) * 8
-        k = (448 - msg_len_bits - 1) % 512
-        self.padded_message = ''.join(format(ord(c), '08b') for c in msg) + '1' + '0' * k + format(msg_len_bits, '064b')
-        
-        self.blocks = [self.padded_message[i:i+512] for i in range(0, len(self.padded_message), 512)]
+        self.converted_chars = 0
+        self.current_block = 0
+        self.avalanche.clear()
+        self.bit_grids.clear()
+        for scroll_list in self.all_lists():
+            scroll_list.reset()
         
-        self.final_hash = sha256(msg.encode()).hexdigest()
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        self.stop_mining()
+        if trace is not None:
+            # A prepared trace: MappedTrace, FileTrace, or one received from a presenter
+            self.traces = trace
+            self.message_bytes = trace.message()
+            self.padded_message = trace.padded
+        else:
+            self.message_bytes = msg.encode()
+            self.padded_message = pad_message(self.message_bytes)
+            self.traces = MessageTrace(self.padded_message, compute=False)
+            if self.live.data == self.message_bytes:
+                # Blocks hashed while typing don't need to be compressed again
+                self.traces.resume_from(self.live.midstates)
+        if len(self.message_bytes) > 0:
+            self.binary_converter.start_conversion(self.message_bytes[0])
+
+        # final_hash always comes from hashlib; the traced digest is checked against it.
+        # A saved trace can be shown at once, so only that check goes to the worker.
+        if len(self.traces) - self.traces.ready_blocks > BACKGROUND_TRACE_BLOCKS or (
+                isinstance(trace, MappedTrace) and len(trace) > BACKGROUND_TRACE_BLOCKS):
+            self.final_hash = ""
+            self.job = TraceJob(self.traces)
+        else:
+            for _ in self.traces.compute_midstates():
+                pass
+            self.final_hash = sha256(self.message_bytes).hexdigest()
+
+    def open_trace(self, trace):
+        # Only a preview is decoded for the label, so a mapped message is not read in full
+        message = trace.message()
+        label = str(bytes(message[:100]), 'utf-8', 'replace')
+        # Fonts can't render control characters (a NUL raises), so binary data shows them as '.'
+        label = ''.join(c if c.isprintable() else '.' for c in label)
+        if len(message) > 100:
+            label = f"{label}... ({len(message)} bytes)"
+        self.update_message(label, trace)
+
+    def open_file(self, path):
+        # False (and the current session kept) when the drop is a folder or can't be read
+        try:
+            trace = FileTrace(path)
+        except (OSError, ValueError) as error:
+            print(f"Can't open {path}: {error}", file=sys.stderr)
+            return False
+        self.update_message(f"{os.path.basename(path)} ({trace.length} bytes)", trace)
+        return True
+
+    def save_trace(self):
+        if isinstance(self.traces, FileTrace):
+            print("Dropped files are not saved as traces; use --save-trace --file", file=sys.stderr)
+            return
+        path = time.strftime("trace_%Y%m%d-%H%M%S.sha256t")
+        self.finish_trace()
+        save_trace(self.traces, path)
+        print(f"Trace written to {path}", file=sys.stderr)
+
+    def finish_trace(self):
+        # Blocks until the background trace, if any, is complete
+        if self.job is not None:
+            self.job.thread.join()
+            self.final_hash = self.job.final_hash
+            self.job = None
+
+    def current_frame(self):
+        # Inverse of apply_frame, used to broadcast what is on screen
+        if self.current_step == 1 and not self.conversion_complete:
+            return (1, 0, self.current_char_index, self.binary_converter.animation_step)
+        if self.current_step <= 3:
+            return (self.current_step, 0, -1 if self.current_step == 1 else 0, 0)
+        if self.current_step == 4:
+            return (4, self.current_block, self.current_w, 0)
+        return (5, self.current_block, self.calculation_h, int(self.final_step5))
+
+    def apply_frame(self, frame):
+        step, block, index, sub = frame
+        self.current_step = step
+        self.current_block = block
+        if step == 1 and index >= 0:
+            self.conversion_complete = False
+            self.current_char_index = index
+            self.converted_chars = index
+            self.binary_converter.start_conversion(self.message_bytes[index])
+            self.binary_converter.animation_step = sub
+            return
+        self.conversion_complete = True
+        self.converted_chars = len(self.message_bytes)
+        self.binary_converter.show_conversion = False
+        self.current_w = index if step == 4 else (63 if step == 5 else 0)
+        self.calculation_h = index if step == 5 else 0
+        self.final_step5 = step == 5 and bool(sub)
 
     def next_step(self):
+        if self.current_step == 1 and not self.conversion_complete:
+            # Skip the rest of the byte-by-byte animation (a dropped file has millions of bytes)
+            self.conversion_complete = True
+            self.converted_chars = len(self.message_bytes)
+            self.binary_converter.show_conversion = False
+            return
         if self.current_step < self.total_steps and (self.conversion_complete or self.current_step == 0):
             self.current_step += 1
+            # W0 / round 1 get their full delay too
+            self.last_w_update = self.clock()
 
     def prev_step(self):
         if self.current_step > 0:
             self.current_step -= 1
+            self.last_w_update = self.clock()
             if self.current_step == 0:
                 self.current_char_index = 0
                 self.conversion_complete = False
-                if len(self.message) > 0:
-                    self.binary_converter.start_conversion(self.message[0])
+                self.converted_chars = 0
+                if len(self.message_bytes) > 0:
+                    self.binary_converter.start_conversion(self.message_bytes[0])
+
+    def select_block(self, index):
+        if 0 <= index < len(self.traces) and index != self.current_block:
+            self.current_block = index
+            self.current_w = 0
+            self.calculation_h = 0
+            self.final_step5 = False
+            self.last_w_update = self.clock()
+            self.w_list.reset()
+            self.k_list.reset()
+
+    def toggle_avalanche(self):
+        if self.current_step >= 4:
+            self.show_avalanche = not self.show_avalanche
+            self.show_bits = False
+
+    def toggle_bits(self):
+        if self.current_step >= 4:
+            self.show_bits = not self.show_bits
+            self.show_avalanche = False
+
+    def start_mining(self):
+        self.stop_mining()
+        self.miner = Miner(self.message_bytes, self.mine_bits, self.mine_double, self.mine_jobs)
+
+    def stop_mining(self):
+        if self.miner is not None:
+            self.miner.cancel()
+            self.miner = None
+
+    def toggle_mining(self):
+        if self.miner is not None:
+            self.stop_mining()
+        elif self.current_step >= 5:
+            if isinstance(self.traces, FileTrace):
+                print("Mining needs the message in memory; dropped files are not mined", file=sys.stderr)
+                return
+            self.show_avalanche = self.show_bits = False
+            self.start_mining()
+
+    def handle_mining_key(self, key):
+        # The mining view takes every key while it is open
+        if self.miner is None:
+            return False
+        if key in (pygame.K_m, pygame.K_ESCAPE):
+            self.stop_mining()
+        elif key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+            change = 1 if key == pygame.K_RIGHTBRACKET else -1
+            self.mine_bits = max(1, min(64, self.mine_bits + change))
+            self.start_mining()
+        elif key == pygame.K_d:
+            self.mine_double = not self.mine_double
+            self.start_mining()
+        elif key == pygame.K_RETURN and self.miner.digest is not None:
+            self.open_mined()
+        return True
+
+    def open_mined(self):
+        # Round trace of the winning attempt; for double SHA-256 that is the outer hash
+        miner = self.miner
+        data = miner.message()
+        label = f"{self.message} + nonce {miner.nonce:016x}"
+        if miner.double:
+            data = sha256(data).digest()
+            label = f"SHA-256 of ({label})"
+        self.update_message(label, MessageTrace(pad_message(data)))
+        self.apply_frame((5, len(self.traces) - 1, 0, 0))
+        self.last_w_update = self.clock()
+
+    def view_cached(self, cache, key, make):
+        # LRU like MessageTrace.cache: scrubbing a long message keeps only the last blocks shown
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = make()
+            if len(cache) > self.view_cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def bit_grid(self):
+        # W bits at step 4, a..h after every round at step 5
+        schedule = self.current_step == 4
+
+        def make():
+            trace = self.traces[self.current_block]
+            if schedule:
+                return bit_grid(trace.w, trace.w[0], BIT_GRID_RECT.size)
+            return bit_grid(trace.rounds, trace.h_in, BIT_GRID_RECT.size)
+        return self.view_cached(self.bit_grids, (self.current_block, schedule), make)
+
+    def avalanche_trace(self):
+        # Toggling back to a recent block is instant
+        return self.view_cached(self.avalanche, self.current_block, lambda: AvalancheTrace(
+            self.traces, self.current_block, len(self.message_bytes)))
+
+    def all_lists(self):
+        return [self.char_list, self.block_list, self.w_list, self.k_list]
+
+    def sync_lists(self):
+        self.char_list.set_count(self.converted_chars)
+        self.block_list.set_count(len(self.traces))
+        self.w_list.set_count(self.current_w + 1)
+        self.k_list.set_count(self.current_w + 1)
+
+    def scroll_lists(self):
+        # Lists shown at the current step, in keyboard focus order
+        if 1 <= self.current_step <= 3 and not self.conversion_complete:
+            return [self.char_list]
+        if self.current_step == 3:
+            return [self.block_list]
+        if (self.current_step == 4 and self.traces.is_ready(self.current_block)
+                and not (self.show_avalanche or self.show_bits)):
+            return [self.w_list, self.k_list]
+        return []
+
+    def handle_scroll_key(self, key, mod):
+        # PageUp/PageDown/Home/End; the timeline owns them at steps 4-5 unless Shift is held
+        if self.current_step >= 4 and not mod & pygame.KMOD_SHIFT:
+            return False
+        lists = self.scroll_lists()
+        if not lists:
+            return False
+        self.sync_lists()
+        return all([scroll_list.handle_key(key) for scroll_list in lists])
+
+    def handle_wheel(self, pos, dy):
+        lists = self.scroll_lists()
+        self.sync_lists()
+        hovered = [scroll_list for scroll_list in lists if scroll_list.rect.collidepoint(pos)]
+        for scroll_list in hovered or lists:
+            scroll_list.handle_wheel(dy)
+
+    # Timeline of steps 4-5: for every block, W0..W63 then rounds 1..64.
+    # A position maps straight to (block, step, index); the block's trace comes
+    # from its midstate checkpoint, so any jump is shown without replaying.
+    TIMELINE_BLOCK = 128
+
+    def timeline_length(self):
+        return len(self.traces) * self.TIMELINE_BLOCK
+
+    def timeline_position(self):
+        if self.current_step == 4:
+            return self.current_block * self.TIMELINE_BLOCK + self.current_w
+        if self.current_step >= 5:
+            return self.current_block * self.TIMELINE_BLOCK + 64 + self.calculation_h
+        return None
+
+    def seek(self, position):
+        position = max(0, min(position, self.timeline_length() - 1))
+        self.current_block, offset = divmod(position, self.TIMELINE_BLOCK)
+        self.conversion_complete = True
+        self.w_list.reset()
+        self.k_list.reset()
+        if offset < 64:
+            self.current_step = 4
+            self.current_w = offset
+            self.calculation_h = 0
+            self.final_step5 = False
+        else:
+            self.current_step = 5
+            self.current_w = 63
+            self.calculation_h = offset - 64
+            self.final_step5 = self.calculation_h >= 63
+        self.last_w_update = self.clock()
+
+    def go_to(self, block, round_index):
+        self.seek(block * self.TIMELINE_BLOCK + 64 + round_index)
+
+    def seek_to_x(self, x):
+        fraction = (x - self.timeline_rect.x) / self.timeline_rect.w
+        self.seek(int(fraction * self.timeline_length()))
+
+    def timeline_hit(self, pos):
+        return self.current_step >= 4 and self.timeline_rect.inflate(0, 16).collidepoint(pos)
+
+    def handle_timeline_key(self, key):
+        position = self.timeline_position()
+        if position is None:
+            return False
+        if key == pygame.K_HOME:
+            self.seek(0)
+        elif key == pygame.K_END:
+            self.seek(self.timeline_length() - 1)
+        elif key == pygame.K_PAGEUP:
+            self.seek(position - 16)
+        elif key == pygame.K_PAGEDOWN:
+            self.seek(position + 16)
+        elif key == pygame.K_g:
+            self.goto_text = ""
+        else:
+            return False
+        return True
+
+    def handle_goto_key(self, event):
+        # "R" jumps to round R of the current block, "B,R" to round R of block B (1-based)
+        if event.key == pygame.K_RETURN:
+            numbers = [int(n) for n in re.findall(r'\d+', self.goto_text)]
+            if len(numbers) == 1:
+                self.go_to(self.current_block, max(1, min(numbers[0], 64)) - 1)
+            elif len(numbers) >= 2:
+                block = max(1, min(numbers[0], len(self.traces))) - 1
+                self.go_to(block, max(1, min(numbers[1], 64)) - 1)
+            self.goto_text = None
+        elif event.key == pygame.K_ESCAPE:
+            self.goto_text = None
+        elif event.key == pygame.K_BACKSPACE:
+            self.goto_text = self.goto_text[:-1]
+        elif event.unicode and event.unicode in "0123456789, ":
+            self.goto_text += event.unicode
 
     def update(self):
         self.binary_converter.update()
+        if self.current_step == 0:
+            # Capped so a long message (pasted or from the command line) never blocks a frame
+            self.live.update(self.message.encode(), BACKGROUND_TRACE_BLOCKS)
         
         if self.current_step == 1 and not self.conversion_complete:
             if not self.binary_converter.show_conversion:
-                if self.current_char_index < len(self.message) - 1:
+                if self.current_char_index < len(self.message_bytes) - 1:
                     self.current_char_index += 1
-                    self.binary_converter.start_conversion(self.message[self.current_char_index])
-                    self.binary_result.append(format(ord(self.message[self.current_char_index-1]), '08b'))
+                    self.binary_converter.start_conversion(self.message_bytes[self.current_char_index])
+                    self.converted_chars += 1
                 else:
-                    if len(self.message) > 0:
-                        self.binary_result.append(format(ord(self.message[-1]), '08b'))
+                    if len(self.message_bytes) > 0:
+                        self.converted_chars += 1
                     self.conversion_complete = True
 
+        if self.job is not None and self.job.finished():
+            self.final_hash = self.job.final_hash
+            self.job = None
+
+        if self.current_step >= 4 and not self.traces.is_ready(self.current_block):
+            # Wait for the worker before animating this block
+            self.last_w_update = self.clock()
+            return
+        if self.current_step == 3:
+            self.current_w = 0
+        if self.current_step == 4:
+            self.calculation_h = 0
+            self.final_step5 = False
+            if self.current_w < 63:
+                current_time = self.clock()
+                if current_time - self.last_w_update > self.w_update_delay:  
+                    self.last_w_update = current_time
+                    self.current_w += 1
+        if self.current_step >= 5:
+            if self.calculation_h < 63:
+                current_time = self.clock()
+                if current_time - self.last_w_update > self.w_update_delay:  
+                    self.last_w_update = current_time
+                    self.calculation_h += 1
+            else:
+                self.final_step5 = True
+
+    def next_tick(self, now):
+        # When update() will next change something; None while nothing is animating
+        ticks = []
+        converter_tick = self.binary_converter.next_tick()
+        if converter_tick is not None:
+            ticks.append(converter_tick)
+        if self.current_step == 1 and not self.conversion_complete and not self.binary_converter.show_conversion:
+            return now
+        if self.current_step == 0 and self.live.digest is None:
+            return now
+        if self.current_step == 3 and self.current_w != 0:
+            return now
+        if self.current_step == 4:
+            if self.calculation_h != 0 or self.final_step5:
+                return now
+            if self.current_w < 63:
+                ticks.append(self.last_w_update + self.w_update_delay)
+        if self.current_step >= 5:
+            if self.calculation_h < 63:
+                ticks.append(self.last_w_update + self.w_update_delay)
+            elif not self.final_step5:
+                return now
+        if self.job is not None or (self.miner is not None and self.miner.running()):
+            # Progress bar / hashrate refresh
+            ticks.append(now + 0.1)
+        return min(ticks) if ticks else None
+
+    def frame_key(self):
+        converter = self.binary_converter
+        self.sync_lists()
+        return (tuple(scroll_list.offset for scroll_list in self.all_lists()),
+                self.message, self.live.ready_blocks(), self.current_char_index, self.converted_chars,
+                converter.show_conversion, converter.animation_step,
+                self.current_w, self.calculation_h, self.final_step5,
+                int(self.job.progress() * 100) if self.job is not None else None,
+                (self.miner.attempts, self.miner.digest, int(self.miner.elapsed * 10)) if self.miner is not None else None)
+
+    def layout_key(self):
+        # Thay đổi ở đây cần vẽ lại toàn màn hình
+        return (self.current_step, self.conversion_complete, self.current_block, self.goto_text,
+                self.show_avalanche, self.show_bits, self.clock.speed,
+                (self.mine_bits, self.mine_double) if self.miner is not None else None,
+                self.job is None, self.traces.is_ready(self.current_block),
+                self.message if self.current_step > 0 else None)
+
+    def dirty_regions(self):
+        rects = []
+        if self.current_step == 0:
+            # Input box and the live digest under it
+            rects.append(pygame.Rect(0, self.input_box.y - 5, WIDTH, self.input_box.h + 45))
+        elif self.current_step == 1 and not self.conversion_complete:
+            rects += [self.binary_converter.area(), pygame.Rect(0, 375, WIDTH, HEIGHT - 375)]
+        elif self.miner is not None:
+            rects.append(pygame.Rect(0, 125, WIDTH, HEIGHT - 140))
+        elif self.current_step >= 4 and (self.show_avalanche or self.show_bits):
+            # Round marker on the heatmap / bit grid and the lines under it
+            rects.append(pygame.Rect(0, AVALANCHE_RECT.y - 5, WIDTH, HEIGHT - AVALANCHE_RECT.y + 5))
+        elif self.current_step == 3:
+            rects.append(self.block_list.rect)
+        elif self.current_step == 4:
+            # W column, K column and the calculation panel below them
+            rects += [pygame.Rect(40, 160, 350, 495), pygame.Rect(940, 160, 260, 495),
+                      pygame.Rect(0, 660, WIDTH, HEIGHT - 660)]
+        elif self.current_step >= 5:
+            # Round calculations and final hash
+            rects.append(pygame.Rect(0, 195, WIDTH, HEIGHT - 195))
+        if self.job is not None:
+            rects.append(PROGRESS_RECT)
+        return rects
+
+    def cache_key(self, frame, layout):
+        # Frames are only reused once the trace is complete; the digest tells messages apart
+        if self.current_step == 0 or self.job is not None or self.miner is not None:
+            return None
+        return (self.final_hash, layout, frame)
+
+    def invalidate(self):
+        self.last_layout = None
+
+    def render(self, screen):
+        # Returns None when the whole screen was redrawn, otherwise the changed rects
+        frame = self.frame_key()
+        layout = self.layout_key()
+        if layout != self.last_layout:
+            rects = None
+        elif frame == self.last_frame:
+            return []
+        else:
+            rects = self.dirty_regions()
+
+        # Frames are composed off screen, so the cached copy never holds the perf overlay
+        if self.canvas is None or self.canvas.get_size() != screen.get_size():
+            self.canvas = pygame.Surface(screen.get_size(), 0, screen)
+            rects = None
+        key = self.cache_key(frame, layout)
+        cached = self.frame_cache.get(key) if key is not None else None
+        if cached is not None:
+            # A hit goes straight to the screen; the canvas is behind until its next full draw
+            self.shown = cached
+        else:
+            if self.shown is not self.canvas:
+                rects = None
+            started = time.perf_counter()
+            if rects is None:
+                self.draw(self.canvas)
+            elif rects:
+                # One draw pass clipped to the union of the rects instead of one full pass per rect
+                self.canvas.set_clip(rects[0].unionall(rects[1:]))
+                self.draw(self.canvas)
+                self.canvas.set_clip(None)
+            if key is not None and time.perf_counter() - started >= self.frame_cache.min_draw_seconds:
+                self.frame_cache.put(key, self.canvas)
+            self.shown = self.canvas
+
+        if rects is None:
+            screen.blit(self.shown, (0, 0))
+        elif rects:
+            # Overlapping rects would be copied twice; one blit of the union is cheaper
+            union = rects[0].unionall(rects[1:])
+            screen.blit(self.shown, union, union)
+
+        self.last_frame = frame
+        self.last_layout = layout
+        return rects
+
     def draw(self, screen):
+        self.sync_lists()
         screen.fill(WHITE)
         
-        title = title_font.render("SHA-256 Algorithm Visualization", True, BLACK)
+        title = text_cache.render(title_font, "SHA-256 Algorithm Visualization", BLACK)
         screen.blit(title, (WIDTH//2 - title.get_width()//2, 20))
 
         if self.current_step == 0:
             self.text = self.message
-            txt_surface = font.render(self.text, True, pygame.Color('black'))
+            # Only the end of a long message; rendering all of it takes longer than a frame
+            shown = self.text if len(self.text) <= 100 else "..." + self.text[-100:]
+            txt_surface = text_cache.render(font, shown, BLACK)
             width = max(600, txt_surface.get_width() + 10)
-            text = title_font.render("Enter a message to hash:", True, BLACK)
-            screen.blit(text, (self.input_box.x , self.input_box.y - 40))
+            text_cache.draw(screen, title_font, "Enter a message to hash:", BLACK, (self.input_box.x , self.input_box.y - 40))
             self.input_box.w = width
             screen.blit(txt_surface, (self.input_box.x + 10, self.input_box.y + 10))
             pygame.draw.rect(screen, self.color, self.input_box, 3)
+            if self.live.data == self.message.encode():
+                blocks = "block" if self.live.block_count == 1 else "blocks"
+                digest = self.live.digest
+                if digest is None:
+                    digest = f"hashing... {self.live.ready_blocks()}/{self.live.block_count} blocks"
+                text_cache.draw(screen, small_font, f"{self.live.block_count} {blocks}   SHA-256: {digest}",
+                                GRAY, (self.input_box.x, self.input_box.bottom + 12))
 
             pygame.draw.rect(screen, self.button_color, self.button_box)
-            button_text = title_font.render("Visualize", True, pygame.Color('black'))
-            screen.blit(button_text, (self.button_box.x + 15, self.button_box.y + 10))
+            text_cache.draw(screen, title_font, "Visualize", BLACK, (self.button_box.x + 15, self.button_box.y + 10))
 
         if self.current_step > 0:
-            msg_text = font.render(f"Input Message: {self.message}", True, BLACK)
-            screen.blit(msg_text, (50, 50))
+            message = self.message
+            if len(message) > 100:
+                # Only what fits on one line; rendering a multi-megabyte string takes seconds
+                message = f"{message[:100]}... ({len(message)} characters)"
+            text_cache.draw(screen, font, f"Input Message: {message}", BLACK, (50, 50))
+            if self.clock.speed != 1:
+                text_cache.draw(screen, small_font, f"Speed {self.clock.speed:g}x (+/-)", GRAY, (WIDTH - 150, 25))
+        if self.job is not None:
+            self.draw_progress(screen)
 
         if self.current_step == 1 or self.current_step == 2 or self.current_step == 3:
-            step_text = font.render("Step 1: Convert characters to binary", True, BLUE)
-            screen.blit(step_text, (50, 90))
+            text_cache.draw(screen, font, "Step 1: Convert characters to binary", BLUE, (50, 90))
             
             if not self.conversion_complete:
                 self.binary_converter.draw(screen)
             
-            if len(self.binary_result) > 0:
+            if self.converted_chars > 0:
                 if self.conversion_complete:
                     result_y = 160
-                    complete_binary = ''.join(self.binary_result)
                     # Giới hạn hiển thị chuỗi binary
-                    max_display_length = 70
-                    
-                    if len(complete_binary) > max_display_length:
-                        display_binary = complete_binary[:35] + "..." + complete_binary[-35:]
-                    else:
-                        display_binary = complete_binary
+                    display_binary = bit_preview(self.message_bytes, len(self.message_bytes) * 8)
                     
                     # Render chuỗi
-                    final_text = font.render("Final binary string:", True, BLACK)
-                    screen.blit(final_text, (50, result_y - 40))
-                    screen.blit(font.render(display_binary, True, GREEN), (70, result_y - 10))
+                    text_cache.draw(screen, font, "Final binary string:", BLACK, (50, result_y - 40))
+                    text_cache.draw_digits(screen, font, display_binary, GREEN, (70, result_y - 10))
                 else:
                     result_y = 400
-                    result_text = font.render("Converted results:", True, BLACK)
-                    screen.blit(result_text, (50, result_y - 20 ))
-                    
-                    for i, binary in enumerate(self.binary_result):
-                        char_text = font.render(f"'{self.message[i]}' = {binary}", True, GREEN)
-                        if (i<15):
-                            screen.blit(char_text, (70, result_y + i*25))
-                        elif (i<30):
-                            screen.blit(char_text, (250, result_y + (i-15)*25))
-                        elif (i<45):
-                            screen.blit(char_text, (430, result_y + (i-30)*25))
-                        elif (i<60):
-                            screen.blit(char_text, (610, result_y + (i-45)*25))
-                        elif (i<75):
-                            screen.blit(char_text, (790, result_y + (i-60)*25))
+                    text_cache.draw(screen, font, "Converted results:", BLACK, (50, result_y - 20 ))
+                    self.char_list.draw(screen, lambda i, pos: text_cache.draw(
+                        screen, font, f"{byte_label(self.message_bytes[i])} = {self.message_bytes[i]:08b}", GREEN, pos))
         
         if self.current_step == 2 or self.current_step == 3:
             self.draw_step2(screen)
         if self.current_step == 3:
-            self.current_w = 0
             self.draw_step3(screen)
-        if self.current_step == 4:
+        if self.miner is not None:
+            self.draw_mining(screen)
+        elif self.current_step >= 4 and self.show_avalanche:
+            self.draw_avalanche(screen)
+        elif self.current_step >= 4 and self.show_bits:
+            self.draw_bits(screen)
+        elif self.current_step == 4:
             self.draw_step3b(screen)
             self.draw_step4(screen)
-            self.calculation_h = 0
-            self.final_step5 = False
-            if self.current_w < 63:
-                current_time = time.time()
-                if current_time - self.last_w_update > self.w_update_delay:  
-                    self.last_w_update = current_time
-                    self.current_w += 1
-        if self.current_step >= 5:
+        elif self.current_step >= 5:
             self.draw_step5(screen)
-            if self.calculation_h < 63:
-                current_time = time.time()
-                if current_time - self.last_w_update > self.w_update_delay:  
-                    self.last_w_update = current_time
-                    self.calculation_h += 1
-            else:
-                self.final_step5 = True
+        if self.current_step >= 4:
+            self.draw_timeline(screen)
+
+    def draw_progress(self, screen):
+        progress = self.job.progress()
+        x, y, w, _ = PROGRESS_RECT
+        pygame.draw.rect(screen, WHITE, PROGRESS_RECT)
+        text_cache.draw(screen, small_font, f"Computing trace: {int(progress * 100)}% (Esc to cancel)", GRAY, (x, y))
+        pygame.draw.rect(screen, LIGHT_BLUE, (x, y + 22, w, 10))
+        pygame.draw.rect(screen, BLUE, (x, y + 22, int(w * progress), 10))
+
+    def draw_pending(self, screen, y):
+        text_cache.draw(screen, font, f"Block {self.current_block + 1} is still being computed...", GRAY, (50, y))
+
+    def draw_avalanche(self, screen):
+        text_cache.draw(screen, font, f"Avalanche effect - Block {self.current_block + 1}/{len(self.traces)} (A to go back)",
+                        BLUE, (50, 90))
+        if np is None:
+            text_cache.draw(screen, font, "Avalanche mode needs NumPy (pip install numpy)", RED, (50, 130))
+            return
+        if not self.traces.is_ready(self.current_block):
+            self.draw_pending(screen, 130)
+            return
+        avalanche = self.avalanche_trace()
+        if avalanche.flips == 0:
+            text_cache.draw(screen, font, "This block only holds padding, there are no message bits to flip", GRAY, (50, 130))
+            return
+
+        bits = avalanche.output_bits
+        # Before the last block the output is the chaining value passed on, not the digest
+        output = "digest" if avalanche.final else "chaining value"
+        summary = (f"{avalanche.flips} single-bit flips - {output} bits changed: mean {bits.mean():.1f}, "
+                   f"min {bits.min()}, max {bits.max()} of 256 (ideal 128)")
+        text_cache.draw(screen, font, summary, BLACK, (50, 125))
+
+        rect = AVALANCHE_RECT
+        column = rect.w // 64
+        screen.blit(avalanche.heatmap(rect.size), rect)
+        for k, name in enumerate("abcdefgh"):
+            text_cache.draw(screen, font, name, BLACK, (rect.x - 20, rect.y + k * rect.h // 8 + 20))
+        for i in range(0, 64, 8):
+            text_cache.draw(screen, small_font, str(i + 1), GRAY, (rect.x + i * column, rect.bottom + 4))
+
+        # Vòng hiện tại trên bản đồ nhiệt
+        i = self.calculation_h if self.current_step >= 5 else 63
+        pygame.draw.rect(screen, BLACK, (rect.x + i * column, rect.y, column, rect.h), 1)
+        text_cache.draw(screen, font, f"After round {i + 1}: {avalanche.round_bits(i):.1f} of 256 state bits differ on average",
+                        BLACK, (50, rect.bottom + 28))
+        text_cache.draw(screen, small_font, "white: never differs   blue: differs in half of the variants (ideal)   "
+                        "red: always differs", GRAY, (50, rect.bottom + 58))
+
+    def draw_bits(self, screen):
+        step4 = self.current_step == 4
+        view = "W bits" if step4 else "a..h bits after each round"
+        text_cache.draw(screen, font, f"Step {self.current_step}: {view} - Block {self.current_block + 1}/{len(self.traces)} "
+                        "(B to go back)", BLUE, (50, 90))
+        if np is None:
+            text_cache.draw(screen, font, "The bit view needs NumPy (pip install numpy)", RED, (50, 130))
+            return
+        if not self.traces.is_ready(self.current_block):
+            self.draw_pending(screen, 130)
+            return
+        trace = self.traces[self.current_block]
+        rect = BIT_GRID_RECT
+        column = rect.w // 64
+        screen.blit(self.bit_grid(), rect)
+
+        # Columns not reached yet are faded, the current one is boxed
+        i = self.current_w if step4 else self.calculation_h
+        if i < 63:
+            screen.fill((210, 210, 210), (rect.x + (i + 1) * column, rect.y, rect.w - (i + 1) * column, rect.h),
+                        special_flags=pygame.BLEND_RGB_MAX)
+        pygame.draw.rect(screen, BLACK, (rect.x + i * column, rect.y, column, rect.h), 1)
+        if step4:
+            text_cache.draw(screen, small_font, "bit 31", GRAY, (rect.x - 50, rect.y))
+            text_cache.draw(screen, small_font, "bit 0", GRAY, (rect.x - 50, rect.bottom - 16))
+        else:
+            for k, name in enumerate(STATE_LABELS):
+                text_cache.draw(screen, font, name, BLACK, (rect.x - 20, rect.y + k * rect.h // 8 + 20))
+        for n in range(0, 64, 8):
+            text_cache.draw(screen, small_font, str(n if step4 else n + 1), GRAY, (rect.x + n * column, rect.bottom + 4))
+
+        if step4:
+            line = f"W{i} = {trace.w[i]:032b}"
+        else:
+            changed = sum(bin(x ^ y).count('1') for x, y in zip(trace.state_before(i), trace.state_after(i)))
+            line = f"Round {i + 1}: {changed} of 256 state bits changed"
+        text_cache.draw(screen, font, line, BLACK, (50, rect.bottom + 28))
+        text_cache.draw(screen, small_font, "dark: 1   red: just became 1   pink: just became 0   "
+                        "(compared with the column to the left)", GRAY, (50, rect.bottom + 58))
+
+    def draw_mining(self, screen):
+        miner = self.miner
+        hash_name = "SHA-256(SHA-256(message || nonce))" if miner.double else "SHA-256(message || nonce)"
+        text_cache.draw(screen, font, f"Proof of work - find a nonce so that {hash_name} starts with "
+                        f"{miner.bits} zero bits", BLUE, (50, 90))
+        reused, per_attempt = miner.blocks()
+        lines = [
+            (f"Target: {miner.bits} leading zero bits, 1 in {2 ** miner.bits:,} attempts on average   ([ / ] to change)", BLACK),
+            (f"Hash: {'double SHA-256, as in Bitcoin' if miner.double else 'single SHA-256'}   (D to switch)", BLACK),
+            (f"Midstate reuse: the {reused} full prefix block(s) are hashed once; each attempt compresses "
+             f"only {per_attempt} block(s)", BLACK),
+            (f"Workers: {miner.jobs} process(es), {miner.CHUNK:,} nonces per range", BLACK),
+        ]
+        for n, (line, color) in enumerate(lines):
+            text_cache.draw(screen, font, line, color, (50, 135 + n * 30))
+
+        y = 285
+        text_cache.draw(screen, title_font, f"Hashrate: {miner.hashrate() / 1e6:.2f} MH/s", BLACK, (50, y))
+        text_cache.draw(screen, font, f"Attempts: {miner.attempts:,}   Time: {miner.elapsed:.1f} s", BLACK, (50, y + 45))
+        if miner.digest is not None:
+            zeros = miner.digest[:miner.bits // 4]
+            text_cache.draw(screen, font, f"Found nonce {miner.nonce} (0x{miner.nonce:016x})", GREEN, (50, y + 90))
+            digest = text_cache.draw(screen, font, "Digest: ", BLACK, (50, y + 120))
+            digest = text_cache.draw(screen, font, zeros, RED, digest.topright)
+            text_cache.draw(screen, font, miner.digest[len(zeros):], BLACK, digest.topright)
+            text_cache.draw(screen, font, "Enter: show the rounds of the winning block", BLUE, (50, y + 160))
+        elif miner.running():
+            text_cache.draw(screen, font, "Searching...", GRAY, (50, y + 90))
+        text_cache.draw(screen, small_font, "M or Esc to leave", GRAY, (50, y + 200))
+
+    def draw_timeline(self, screen):
+        rect = self.timeline_rect
+        pygame.draw.rect(screen, LIGHT_BLUE, rect)
+        length = self.timeline_length()
+        blocks = len(self.traces)
+        if blocks <= 64:
+            for block in range(1, blocks):
+                x = rect.x + rect.w * block // blocks
+                pygame.draw.line(screen, GRAY, (x, rect.y - 3), (x, rect.bottom + 2))
+        position = self.timeline_position()
+        x = rect.x + rect.w * position // max(1, length - 1)
+        pygame.draw.rect(screen, BLUE, (rect.x, rect.y, x - rect.x, rect.h))
+        pygame.draw.rect(screen, BLUE, (x - 3, rect.y - 4, 6, rect.h + 8))
+
+        if self.goto_text is not None:
+            prompt = f"Go to round (or block, round): {self.goto_text}_"
+            text_cache.draw(screen, font, prompt, RED, (700, 90))
             
     def draw_step2(self, screen):
         y = 180  
-        text = font.render("Step 2: Padding", True, BLUE)
-        screen.blit(text, (50, y))
+        text_cache.draw(screen, font, "Step 2: Padding", BLUE, (50, y))
         
         padding_y = y + 30
-        msg_binary = ''.join(self.binary_result)
-        max_display_length = 70
-        
-        if len(msg_binary) > max_display_length:
-            display_binary = msg_binary[:35] + "..." + msg_binary[-35:]
-        else:
-            display_binary = msg_binary
-        padding_one = font.render("Add '1' bit:", True, BLACK)
-        screen.blit(padding_one, (50, padding_y))
-        screen.blit(font.render(display_binary + "1", True, GREEN), (70, padding_y + 25))
+        display_binary = bit_preview(self.message_bytes, len(self.message_bytes) * 8)
+        padded_bits = len(self.padded_message) * 8
+        text_cache.draw(screen, font, "Add '1' bit:", BLACK, (50, padding_y))
+        text_cache.draw_digits(screen, font, display_binary + "1", GREEN, (70, padding_y + 25))
         
-        padding_zeros = font.render("Add '0' padding:", True, BLACK)
-        screen.blit(padding_zeros, (50, padding_y + 50))
-        padding_preview = self.padded_message[:-64]
-        screen.blit(font.render(padding_preview[:35] + "..." + padding_preview[-35:], True, GREEN), 
-                   (70, padding_y + 75))
+        text_cache.draw(screen, font, "Add '0' padding:", BLACK, (50, padding_y + 50))
+        text_cache.draw_digits(screen, font, bit_preview(self.padded_message, padded_bits - 64), GREEN,
+                               (70, padding_y + 75))
         
-        length_bits = font.render("Add message length (64 bits):", True, BLACK)
-        screen.blit(length_bits, (50, padding_y + 100))
-        screen.blit(font.render(self.padded_message[-64:], True, GREEN), 
-                   (70, padding_y + 125))
+        text_cache.draw(screen, font, "Add message length (64 bits):", BLACK, (50, padding_y + 100))
+        text_cache.draw_digits(screen, font, bit_string(self.padded_message, padded_bits - 64, padded_bits), GREEN,
+                               (70, padding_y + 125))
 
     def draw_step3(self, screen):
         y = 355
-        text = font.render("Step 3: Split into 512-bit blocks", True, BLUE)
-        screen.blit(text, (50, y))
-
-        block_y = y + 25
-        for i, block in enumerate(self.blocks):
-            if i >= 4:  
-                overflow_text = font.render(f"... ({len(self.blocks) - 4} more blocks)", True, GRAY)
-                screen.blit(overflow_text, (50, block_y + i * 25))
-                break
-            block_preview = block[:32] + "..." + block[-32:]  
-            block_text = font.render(f"Block {i+1}: {block_preview} ({len(block)} bits)", True, BLACK)
-            screen.blit(block_text, (50, block_y + i * 25))
+        text_cache.draw(screen, font, "Step 3: Split into 512-bit blocks", BLUE, (50, y))
+
+        self.block_list.draw(screen, lambda i, pos: text_cache.draw(
+            screen, font, f"Block {i+1}: {bit_preview(self.traces.block(i), 512, 32)} (512 bits)", BLACK, pos))
 
     def draw_step3b(self, screen):
         y = 90
-        text = font.render("Step 3: Split into 512-bit blocks", True, BLUE)
-        screen.blit(text, (50, y))
-
-        block_y = y + 25
-        for i, block in enumerate(self.blocks):
-            if i >= 4:  
-                overflow_text = font.render(f"... ({len(self.blocks) - 4} more blocks)", True, GRAY)
-                screen.blit(overflow_text, (50, block_y + i * 25))
-                break
-            block_preview = block[:32] + "..." + block[-32:]  
-            block_text = font.render(f"Block {i+1}: {block_preview} ({len(block)} bits)", True, BLACK)
-            screen.blit(block_text, (50, block_y + i * 25))
+        text_cache.draw(screen, font, "Step 3: Split into 512-bit blocks", BLUE, (50, y))
+
+        # Only the block being scheduled fits above the W panel; Step 3 lists them all
+        i = self.current_block
+        block_preview = bit_preview(self.traces.block(i), 512, 32)
+        text_cache.draw(screen, font, f"Block {i+1}/{len(self.traces)}: {block_preview} (512 bits)", BLUE, (50, y + 25))
         
     def draw_step4(self, screen):
+        if not self.traces.is_ready(self.current_block):
+            self.draw_pending(screen, 165)
+            return
+        trace = self.traces[self.current_block]
+        w_values = trace.w
         y = 135
-        text = font.render("Step 4: Message Schedule (W Array)", True, BLUE)
-        screen.blit(text, (50, y))
+        text_cache.draw(screen, font, f"Step 4: Message Schedule (W Array) - Block {self.current_block + 1}/{len(self.traces)}", BLUE, (50, y))
         
         w_y = y + 30
-        block = self.blocks[0]
-        
-        for i in range(16):
-            self.w_values[i] = int(block[i*32:(i+1)*32], 2)
         
-        def right_rotate(value, amount):
-            return ((value >> amount) | (value << (32 - amount))) & 0xFFFFFFFF
+        text_cache.draw(screen, font, "σ₀(x) = (x >> 7) ⊕ (x ≫ 18) ⊕ (x ≫ 3)", BLACK, (400, 300))
+        text_cache.draw(screen, font, "σ₁(x) = (x ≫ 17) ⊕ (x ≫ 19) ⊕ (x ≫ 10)", BLACK, (400, 325))
 
-        def sigma0(x):
-            return right_rotate(x, 7) ^ right_rotate(x, 18) ^ (x >> 3)
-
-        def sigma1(x):
-            return right_rotate(x, 17) ^ right_rotate(x, 19) ^ (x >> 10)
-        
-        sigma0_text1 = font.render("σ₀(x) = (x >> 7) ⊕ (x ≫ 18) ⊕ (x ≫ 3)", True, BLACK)
-        sigma1_text1 = font.render("σ₁(x) = (x ≫ 17) ⊕ (x ≫ 19) ⊕ (x ≫ 10)", True, BLACK)
-        screen.blit(sigma0_text1, (400, 300))
-        screen.blit(sigma1_text1, (400, 325))
-
-        for i in range(16, 64):
-            if i <= self.current_w:
-                w_i_minus_2 = self.w_values[i - 2]
-                w_i_minus_7 = self.w_values[i - 7]
-                w_i_minus_15 = self.w_values[i - 15]
-                w_i_minus_16 = self.w_values[i - 16]
-                
-                new_w = (sigma1(w_i_minus_2) + w_i_minus_7 + sigma0(w_i_minus_15) + w_i_minus_16) & 0xFFFFFFFF
-                self.w_values[i] = new_w
-
-        w_display_y = w_y
-        for i in range(max(0, self.current_w - 15), self.current_w + 1):
-            if 0 <= i < 64:
-                text = font.render(f"W{i}: {self.w_values[i]:08x}", True, BLACK)
-                screen.blit(text, (50, w_display_y - self.scroll_offset))
-                w_display_y += 30
+        def draw_w(i, pos):
+            label = text_cache.draw(screen, font, f"W{i}: ", BLACK, pos)
+            text_cache.draw_digits(screen, font, f"{w_values[i]:08x}", BLACK, label.topright)
+        self.w_list.draw(screen, draw_w)
 
         # Display calculation for current W
         calc_y = w_y + 500
         if 16 <= self.current_w < 64:
             i = self.current_w
-            w_i_minus_2 = self.w_values[i - 2]
-            w_i_minus_7 = self.w_values[i - 7]
-            w_i_minus_15 = self.w_values[i - 15]
-            w_i_minus_16 = self.w_values[i - 16]
+            w_i_minus_2 = w_values[i - 2]
+            w_i_minus_7 = w_values[i - 7]
+            w_i_minus_15 = w_values[i - 15]
+            w_i_minus_16 = w_values[i - 16]
             
-            text = font.render(f"Calculating W{i}:", True, BLUE)
-            screen.blit(text, (50, calc_y))
+            text_cache.draw(screen, font, f"Calculating W{i}:", BLUE, (50, calc_y))
             
             formula = f"W{i} = σ₁(W{i-2}) + W{i-7} + σ₀(W{i-15}) + W{i-16}"
-            text = font.render(formula, True, BLACK)
-            screen.blit(text, (50, calc_y + 30))
+            text_cache.draw(screen, font, formula, BLACK, (50, calc_y + 30))
             
             values = f"    = σ₁({w_i_minus_2:08x}) + {w_i_minus_7:08x} + σ₀({w_i_minus_15:08x}) + {w_i_minus_16:08x}"
-            text = font.render(values, True, BLACK)
-            screen.blit(text, (50, calc_y + 60))
+            text_cache.draw(screen, font, values, BLACK, (50, calc_y + 60))
             
-            result = f"    = {self.w_values[i]:08x}"
-            text = font.render(result, True, BLACK)
-            screen.blit(text, (50, calc_y + 90))
+            result = f"    = {w_values[i]:08x}"
+            text_cache.draw(screen, font, result, BLACK, (50, calc_y + 90))
 
         # Display K constants on the right
-        k_y = y
-        text = font.render("K Constants:", True, BLUE)
-        screen.blit(text, (950, y))
+        text_cache.draw(screen, font, "K Constants:", BLUE, (950, y))
         
-        k_values = [
-            0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
-            0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
-            0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
-            0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
-            0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
-            0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
-            0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
-            0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
-        ]
-        
-        k_display_y = k_y + 30
-        for i in range(max(0, self.current_w - 15), self.current_w + 1):
-            if 0 <= i < 64:
-                text = font.render(f"K{i}: {k_values[i]:08x}", True, BLACK)
-                screen.blit(text, (950, k_display_y - self.k_scroll_offset))
-                k_display_y += 30
+        def draw_k(i, pos):
+            label = text_cache.draw(screen, font, f"K{i}: ", BLACK, pos)
+            text_cache.draw_digits(screen, font, f"{K_VALUES[i]:08x}", BLACK, label.topright)
+        self.k_list.draw(screen, draw_k)
 
     def draw_step5(self, screen):
-        k_values = [
-            0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
-            0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
-            0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
-            0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
-            0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
-            0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
-            0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
-            0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
-        ]
+        if not self.traces.is_ready(self.current_block):
+            self.draw_pending(screen, 130)
+            return
+        trace = self.traces[self.current_block]
+        last_block = self.current_block == len(self.traces) - 1
         y = 90
-        text = font.render("Step 5: Final Hash Computation", True, BLUE)
-        screen.blit(text, (50, y))
-        
-        # Initial hash values (first 32 bits of the fractional parts of the square roots of the first 8 primes)
-        h_values = [
-            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
-            0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
-        ]
-        labels = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+        text_cache.draw(screen, font, f"Step 5: Final Hash Computation - Block {self.current_block + 1}/{len(self.traces)}", BLUE, (50, y))
         
         # Display initial hash values
-        initial_text = font.render("Initial Hash Values (a b c d e f g h):", True, BLACK)
-        screen.blit(initial_text, (50, y + 40))
+        text_cache.draw(screen, font, "Initial Hash Values (a b c d e f g h):", BLACK, (50, y + 40))
         
         x_start = 50
         y_start = y + 70
@@ -428,176 +1946,1009 @@ class SHA256Visualizer:
         spacing_y = 40
         
         # Display initial values
-        for i, value in enumerate(h_values):
+        for i, value in enumerate(trace.h_in):
             if x + spacing_x > max_width:
                 x = x_start
                 y += spacing_y
-            h_text = font.render(f"{labels[i]}: {value:08x}", True, BLACK)
-            screen.blit(h_text, (x, y))
+            label = text_cache.draw(screen, font, f"{STATE_LABELS[i]}: ", BLACK, (x, y))
+            text_cache.draw_digits(screen, font, f"{value:08x}", BLACK, label.topright)
             x += spacing_x
 
-        def right_rotate(value, amount):
-            return ((value >> amount) | (value << (32 - amount))) & 0xFFFFFFFF
+        i = self.calculation_h
+        a, b, c, d, e, f, g, h = trace.state_before(i)
+        ch_result, maj_result, sigma0_result, sigma1_result, T1, T2 = trace.round_terms(i)
+        w = trace.w[i]
+        k = K_VALUES[i]
+
+        text_cache.draw(screen, font, f"Round {i + 1} Calculations", BLUE, (50, y + 40))
 
-        def ch(x, y, z):
-            return (x & y) ^ (~x & z)
+        text_cache.draw(screen, font, f"Ch(e, f, g) = (e ∧ f) ⊕ (¬e ∧ g)", BLUE, (50, y + 70))
+        
+        text_cache.draw(screen, font, f"Maj(a, b, c) = (a ∧ b) ⊕ (a ∧ c) ⊕ (b ∧ c)", BLUE, (50, y + 100))
+
+        text_cache.draw(screen, font, f"Σ₀(a) = (a ≫ 2) ⊕ (a ≫ 13) ⊕ (a ≫ 22)", BLUE, (50, y + 130))
+
+        text_cache.draw(screen, font, f"Σ₁(e) = (e ≫ 6) ⊕ (e ≫ 11) ⊕ (e ≫ 25)", BLUE, (50, y + 160))
+
+        text_cache.draw(screen, font, f"T₁ = h + Σ₁(e) + Ch(e, f, g) + K{i} + W{i}", BLUE, (50, y + 190))
+
+        text_cache.draw(screen, font, f"T₂ = Σ₀(a) + Maj(a, b, c)", BLUE, (50, y + 220))
+
+        text_cache.draw(screen, font, f"Ch(e, f, g) = ({e:08x} ∧ {f:08x}) ⊕ (¬{e:08x} ∧ {g:08x}) = {ch_result:08x}", BLACK, (50, y + 180 + 70))
+
+        text_cache.draw(screen, font, f"Maj(a, b, c) = ({a:08x} ∧ {b:08x}) ⊕ ({a:08x} ∧ {c:08x}) ⊕ ({b:08x} ∧ {c:08x}) = {maj_result:08x}", BLACK, (50, y + 180 + 100))
 
-        def maj(x, y, z):
-            return (x & y) ^ (x & z) ^ (y & z)
+        text_cache.draw(screen, font, f"Σ₀(a) = ({a:08x} ≫ 2) ⊕ ({a:08x} ≫ 13) ⊕ ({a:08x} ≫ 22) = {sigma0_result:08x}", BLACK, (50, y + 180 + 130))
 
-        def sigma0(x):
-            return right_rotate(x, 2) ^ right_rotate(x, 13) ^ right_rotate(x, 22)
+        text_cache.draw(screen, font, f"Σ₁(e) = ({e:08x} ≫ 6) ⊕ ({e:08x} ≫ 11) ⊕ ({e:08x} ≫ 25) = {sigma1_result:08x}", BLACK, (50, y + 180 + 160))
 
-        def sigma1(x):
-            return right_rotate(x, 6) ^ right_rotate(x, 11) ^ right_rotate(x, 25)
+        text_cache.draw(screen, font, f"T₁ = {h:08x} + {sigma1_result:08x} + {ch_result:08x} + {k:08x} + {w:08x} = {T1:08x}", BLACK, (50, y + 180 + 190))
 
-        # Main compression function
-        working_vars = list(h_values)  # Create a copy of initial hash values
-        a, b, c, d, e, f, g, h = working_vars
+        text_cache.draw(screen, font, f"T₂ = {sigma0_result:08x} + {maj_result:08x} = {T2:08x}", BLACK, (50, y + 180 + 220))
+
+        text_cache.draw(screen, font, "Updates: h=g, g=f, f=e, e=d+T₁, d=c, c=b, b=a, a=T₁+T₂", BLUE, (50, y + 180 + 250))
         
-        for i in range(64):
-            w = self.w_values[i]
-            k = k_values[i]
-            
-            T1 = (h + sigma1(e) + ch(e, f, g) + k + w) & 0xFFFFFFFF
-            T2 = (sigma0(a) + maj(a, b, c)) & 0xFFFFFFFF
-            
-            h = g
-            g = f
-            f = e
-            e = (d + T1) & 0xFFFFFFFF
-            d = c
-            c = b
-            b = a
-            a = (T1 + T2) & 0xFFFFFFFF
-
-            if i == self.calculation_h:
-                step_text = font.render(f"Round {i + 1} Calculations", True, BLUE)
-                screen.blit(step_text, (50, y + 40))
-
-                ch_result = ch(e, f, g)
-                maj_result = maj(a, b, c)
-                sigma0_result = sigma0(a)
-                sigma1_result = sigma1(e)
-                ch_math = font.render(f"Ch(e, f, g) = (e ∧ f) ⊕ (¬e ∧ g)", True, BLUE)
-                screen.blit(ch_math, (50, y + 70))
-                
-                maj_math = font.render(f"Maj(a, b, c) = (a ∧ b) ⊕ (a ∧ c) ⊕ (b ∧ c)", True, BLUE)
-                screen.blit(maj_math, (50, y + 100))
-
-                sigma0_math = font.render(f"Σ₀(a) = (a ≫ 2) ⊕ (a ≫ 13) ⊕ (a ≫ 22)", True, BLUE)
-                screen.blit(sigma0_math, (50, y + 130))
-
-                sigma1_math = font.render(f"Σ₁(e) = (e ≫ 6) ⊕ (e ≫ 11) ⊕ (e ≫ 25)", True, BLUE)
-                screen.blit(sigma1_math, (50, y + 160))
-
-                t1_math = font.render(f"T₁ = h + Σ₁(e) + Ch(e, f, g) + K{i} + W{i}", True, BLUE)
-                screen.blit(t1_math, (50, y + 190))
-
-                t2_math = font.render(f"T₂ = Σ₀(a) + Maj(a, b, c)", True, BLUE)
-                screen.blit(t2_math, (50, y + 220))
-
-                ch_text = font.render(f"Ch(e, f, g) = ({e:08x} ∧ {f:08x}) ⊕ (¬{e:08x} ∧ {g:08x}) = {ch_result:08x}", True, BLACK)
-                screen.blit(ch_text, (50, y + 180 + 70))
-
-                maj_text = font.render(f"Maj(a, b, c) = ({a:08x} ∧ {b:08x}) ⊕ ({a:08x} ∧ {c:08x}) ⊕ ({b:08x} ∧ {c:08x}) = {maj_result:08x}", True, BLACK)
-                screen.blit(maj_text, (50, y + 180 + 100))
-
-                sigma0_text = font.render(f"Σ₀(a) = ({a:08x} ≫ 2) ⊕ ({a:08x} ≫ 13) ⊕ ({a:08x} ≫ 22) = {sigma0_result:08x}", True, BLACK)
-                screen.blit(sigma0_text, (50, y + 180 + 130))
-
-                sigma1_text = font.render(f"Σ₁(e) = ({e:08x} ≫ 6) ⊕ ({e:08x} ≫ 11) ⊕ ({e:08x} ≫ 25) = {sigma1_result:08x}", True, BLACK)
-                screen.blit(sigma1_text, (50, y + 180 + 160))
-
-                t1_text = font.render(f"T₁ = {h:08x} + {sigma1_result:08x} + {ch_result:08x} + {k:08x} + {w:08x} = {T1:08x}", True, BLACK)
-                screen.blit(t1_text, (50, y + 180 + 190))
-
-                t2_text = font.render(f"T₂ = {sigma0_result:08x} + {maj_result:08x} = {T2:08x}", True, BLACK)
-                screen.blit(t2_text, (50, y + 180 + 220))
-
-                update_text = font.render(
-                    f"Updates: h=g, g=f, f=e, e=d+T₁, d=c, c=b, b=a, a=T₁+T₂",
-                    True, BLUE
-                )
-                screen.blit(update_text, (50, y + 180 + 250))
-                
-                updated_text = font.render("Updated Values:", True, BLACK)
-                screen.blit(updated_text, (50, y + 180 + 280))
-                
-                updated_values = font.render(
-                    f"a: {a:08x}, b: {b:08x}, c: {c:08x}, d: {d:08x}, e: {e:08x}, f: {f:08x}, g: {g:08x}, h: {h:08x}",
-                    True, GREEN
-                )
-                screen.blit(updated_values, (50, y + 180 + 310))
-
-        # After all rounds, add the compressed chunk to the current hash value
-        final_hash_values = [
-            (a + h_values[0]) & 0xFFFFFFFF,
-            (b + h_values[1]) & 0xFFFFFFFF,
-            (c + h_values[2]) & 0xFFFFFFFF,
-            (d + h_values[3]) & 0xFFFFFFFF,
-            (e + h_values[4]) & 0xFFFFFFFF,
-            (f + h_values[5]) & 0xFFFFFFFF,
-            (g + h_values[6]) & 0xFFFFFFFF,
-            (h + h_values[7]) & 0xFFFFFFFF
-        ]
+        text_cache.draw(screen, font, "Updated Values:", BLACK, (50, y + 180 + 280))
+        
+        a, b, c, d, e, f, g, h = trace.state_after(i)
+        text_cache.draw(screen, font,
+            f"a: {a:08x}, b: {b:08x}, c: {c:08x}, d: {d:08x}, e: {e:08x}, f: {f:08x}, g: {g:08x}, h: {h:08x}",
+            GREEN, (50, y + 180 + 310))
 
         if self.final_step5:
-            final_text = font.render("Final Hash Values:", True, BLUE)
-            screen.blit(final_text, (50, y + 180 + 340))
+            text_cache.draw(screen, font, "Final Hash Values:", BLUE, (50, y + 180 + 340))
 
             x = 50
-            for i, value in enumerate(final_hash_values):
-                final_value_text = font.render(f"{labels[i]}: {value:08x}", True, BLACK)
-                screen.blit(final_value_text, (x, y + 180 + 370))
+            for i, value in enumerate(trace.h_out):
+                label = text_cache.draw(screen, font, f"{STATE_LABELS[i]}: ", BLACK, (x, y + 180 + 370))
+                text_cache.draw_digits(screen, font, f"{value:08x}", BLACK, label.topright)
                 x += 135
 
-            final_hash = ''.join(f"{value:08x}" for value in final_hash_values)
-            hash_text = font.render(f"Final Hash: {final_hash}", True, BLUE)
-            screen.blit(hash_text, (50, y + 180 + 400))
+            final_hash = ''.join(f"{value:08x}" for value in trace.h_out)
+            if last_block:
+                text_cache.draw(screen, font, f"Final Hash: {final_hash}", BLUE, (50, y + 180 + 400))
 
-            hash_result = sha256(self.message.encode()).hexdigest()
-            hash_result_text = font.render(f"SHA-256 Result: {hash_result}", True, BLUE)
-            screen.blit(hash_result_text, (50, y + 180 + 430))
+                if self.final_hash == final_hash:
+                    check, color = "(matches hashlib)", GREEN
+                else:
+                    check, color = "(hashlib: MISMATCH)", RED
+                result = text_cache.draw(screen, font, f"SHA-256 Result: {self.final_hash} ", BLUE, (50, y + 180 + 430))
+                text_cache.draw(screen, font, check, color, result.topright)
+            else:
+                text_cache.draw(screen, font, f"Hash after block {self.current_block + 1}: {final_hash}", BLUE, (50, y + 180 + 400))
+
+                text_cache.draw(screen, font, "Press DOWN to continue with the next block", GRAY, (50, y + 180 + 430))
+
+# Headless export: the trace of a message as a stream of records, one at a time
+def iter_padded_blocks(stream, info=None, chunk_size=64 * 1024):
+    # Reads a binary stream and yields its padded 64-byte blocks; padding details go into info
+    total = 0
+    pending = b""
+    digest = sha256()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        total += len(chunk)
+        data = pending + chunk
+        full = len(data) - len(data) % 64
+        for i in range(0, full, 64):
+            yield data[i:i + 64]
+        pending = data[full:]
+
+    tail = pad_message(pending)[:-8] + (total * 8).to_bytes(8, 'big')
+    for i in range(0, len(tail), 64):
+        yield tail[i:i + 64]
+    if info is not None:
+        info.update(padding_info(total), sha256=digest.hexdigest())
+
+def padding_info(length):
+    return {"message_bits": length * 8, "zero_bits": ((55 - length) % 64) * 8 + 7,
+            "length_field": (length * 8).to_bytes(8, 'big').hex()}
+
+def iter_trace_records(source, message_id=0, text=None):
+    # source: bytes or a binary file object; text, when given, is written once in an input record
+    if text is not None:
+        yield {"message": message_id, "record": "input", "text": text}
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    state = H_VALUES
+    index = 0
+    padding = {}
+    for block in iter_padded_blocks(source, padding):
+        trace = BlockTrace(index, state, block)
+        yield {"message": message_id, "record": "block", "block": index, "data": block.hex()}
+        yield {"message": message_id, "record": "schedule", "block": index,
+               "w": [f"{value:08x}" for value in trace.w]}
+        for i in range(64):
+            yield {"message": message_id, "record": "round", "block": index, "round": i,
+                   "state": [f"{value:08x}" for value in trace.state_after(i)]}
+        yield {"message": message_id, "record": "hash", "block": index,
+               "h": [f"{value:08x}" for value in trace.h_out]}
+        state = trace.h_out
+        index += 1
+
+    digest = ''.join(f"{value:08x}" for value in state)
+    yield {"message": message_id, "record": "padding", "message_bits": padding["message_bits"],
+           "zero_bits": padding["zero_bits"], "length_field": padding["length_field"]}
+    yield {"message": message_id, "record": "digest", "blocks": index, "sha256": digest,
+           "verified": digest == padding["sha256"]}
+
+def hex_words(words):
+    # uint32 NumPy row -> ["xxxxxxxx", ...]
+    text = words.astype('>u4').tobytes().hex()
+    return [text[i:i + 8] for i in range(0, len(text), 8)]
+
+def iter_batch_trace_records(sources, batch_size=4096):
+    # Same records as iter_trace_records, computed batch_size messages at a time with BatchTrace
+    sources = iter(sources)
+    while True:
+        batch = []
+        for message_id, source, text in sources:
+            if not isinstance(source, (bytes, bytearray, memoryview)):
+                source = source.read()
+            batch.append((message_id, bytes(source), text))
+            if len(batch) == batch_size:
+                break
+        if not batch:
+            return
+        # One BatchTrace per block count: padding every message to the longest one would allocate
+        # round states for zero blocks (one 64 KB line among 4095 short ones: ~8.6 GB)
+        groups = {}
+        for n, (_, message, _) in enumerate(batch):
+            groups.setdefault((len(message) + 8) // 64 + 1, []).append(n)
+        rows = [None] * len(batch)
+        for members in groups.values():
+            trace = BatchTrace([batch[n][1] for n in members])
+            for row, n in enumerate(members):
+                rows[n] = (trace, row)
+
+        for (message_id, message, text), (trace, n) in zip(batch, rows):
+            if text is not None:
+                yield {"message": message_id, "record": "input", "text": text}
+            padded = pad_message(message)
+            blocks = int(trace.block_counts[n])
+            for index in range(blocks):
+                yield {"message": message_id, "record": "block", "block": index,
+                       "data": padded[index * 64:(index + 1) * 64].hex()}
+                yield {"message": message_id, "record": "schedule", "block": index,
+                       "w": hex_words(trace.w[n, index])}
+                rounds = hex_words(trace.rounds[n, index])
+                for i in range(64):
+                    yield {"message": message_id, "record": "round", "block": index, "round": i,
+                           "state": rounds[i * 8:(i + 1) * 8]}
+                yield {"message": message_id, "record": "hash", "block": index,
+                       "h": hex_words(trace.midstates[n, index + 1])}
+
+            digest = trace.hexdigest(n)
+            yield dict({"message": message_id, "record": "padding"}, **padding_info(len(message)))
+            yield {"message": message_id, "record": "digest", "blocks": blocks, "sha256": digest,
+                   "verified": digest == sha256(message).hexdigest()}
+
+CSV_FIELDS = ["message", "record", "block", "index", "values"]
+
+def csv_row(record):
+    index = record.get("round", "")
+    if record["record"] == "input":
+        values = record["text"]
+    elif record["record"] == "block":
+        values = record["data"]
+    elif record["record"] == "schedule":
+        values = ' '.join(record["w"])
+    elif record["record"] == "round":
+        values = ' '.join(record["state"])
+    elif record["record"] == "hash":
+        values = ' '.join(record["h"])
+    elif record["record"] == "padding":
+        values = f"{record['message_bits']} {record['zero_bits']} {record['length_field']}"
+    else:
+        values = f"{record['sha256']} {'ok' if record['verified'] else 'MISMATCH'}"
+    return [record["message"], record["record"], record.get("block", ""), index, values]
+
+def write_trace(records, out, fmt="jsonl"):
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(CSV_FIELDS)
+        for record in records:
+            writer.writerow(csv_row(record))
+    else:
+        for record in records:
+            out.write(json.dumps(record, separators=(',', ':')))
+            out.write("\n")
+
+def iter_sources(messages, files, stdin):
+    # (message id, bytes or binary stream, text or None) for every input, opened lazily.
+    # The id is the argument index, the file path or the stdin line index, so a long message
+    # is not repeated in every record; its text goes once in the input record.
+    for index, message in enumerate(messages):
+        yield index, message.encode(), message
+    for path in files:
+        with open(path, 'rb') as f:
+            yield path, f, None
+    if stdin is not None:
+        for index, line in enumerate(stdin):
+            line = line.rstrip("\r\n")
+            yield index, line.encode(), line
+
+def run_headless(args):
+    stdin = sys.stdin if not args.messages and not args.file else None
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        sources = iter_sources(args.messages, args.file, stdin)
+        if args.engine == "numpy":
+            records = iter_batch_trace_records(sources, args.batch_size)
+        else:
+            records = (record for message_id, source, text in sources
+                       for record in iter_trace_records(source, message_id, text))
+        write_trace(records, out, args.format)
+    finally:
+        if args.output:
+            out.close()
+
+def run_save_trace(args):
+    # Traces the first message (or --file) once, for instant reloading with --trace
+    if args.file:
+        with open(args.file[0], 'rb') as f:
+            data = f.read()
+    else:
+        data = (args.messages[0] if args.messages else "").encode()
+    started = time.perf_counter()
+    trace = MessageTrace(pad_message(data), compute=False)
+    save_trace(trace, args.save_trace)
+    print(f"Wrote {len(trace)} blocks to {args.save_trace} in {time.perf_counter() - started:.1f} s",
+          file=sys.stderr)
+
+# Offscreen export of the walkthrough, rendered by a pool of processes
+export_visualizer = None
+
+def export_worker_init(message):
+    global export_visualizer
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    init_display()
+    export_visualizer = SHA256Visualizer()
+    export_visualizer.update_message(message)
+    export_visualizer.finish_trace()
+
+def export_worker_render(frames, first_index, directory, scale):
+    surface = pygame.Surface((WIDTH, HEIGHT))
+    for offset, frame in enumerate(frames):
+        export_visualizer.apply_frame(frame)
+        export_visualizer.draw(surface)
+        output = surface
+        if scale != 1:
+            output = pygame.transform.smoothscale(surface, (int(WIDTH * scale), int(HEIGHT * scale)))
+        pygame.image.save(output, os.path.join(directory, f"frame_{first_index + offset:06d}.png"))
+    return len(frames)
+
+def load_pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("GIF export needs Pillow (pip install pillow); use a directory for a PNG sequence")
+    return Image
+
+def write_gif(paths, target, durations):
+    Image = load_pillow()
+    frames = (Image.open(path).convert('P', palette=Image.ADAPTIVE) for path in paths)
+    first = next(frames)
+    first.save(target, save_all=True, append_images=frames, duration=[round(d * 1000) for d in durations], loop=0)
+
+def write_ffconcat(directory, count, durations):
+    # Frame timings for ffmpeg: ffmpeg -f concat -i frames.ffconcat out.mp4
+    with open(os.path.join(directory, "frames.ffconcat"), 'w') as f:
+        f.write("ffconcat version 1.0\n")
+        for i in range(count):
+            f.write(f"file frame_{i:06d}.png\nduration {durations[i]:.3f}\n")
+
+def run_export(args):
+    gif = args.export.lower().endswith(".gif")
+    if gif:
+        # Checked before any frame is rendered, not after all of them are on disk
+        load_pillow()
+    message = args.messages[0] if args.messages else ""
+    # Frames and their timing as a live viewer at --speed would see them
+    timed = fast_forward(message)
+    frames = [frame for _, frame in timed]
+    times = [t for t, _ in timed]
+    # Nothing stays on screen for less than one 60 fps frame
+    durations = [max(1 / 60, (b - a) / args.speed) for a, b in zip(times, times[1:])] + [1.0 / args.speed]
+
+    directory = os.path.splitext(args.export)[0] + "_frames" if gif else args.export
+    os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    jobs = args.jobs or os.cpu_count() or 1
+    chunk = max(1, min(64, len(frames) // (jobs * 4) or 1))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=export_worker_init,
+                                                initargs=(message,)) as pool:
+        futures = [pool.submit(export_worker_render, frames[i:i + chunk], i, directory, args.scale)
+                   for i in range(0, len(frames), chunk)]
+        done_frames = 0
+        for future in concurrent.futures.as_completed(futures):
+            done_frames += future.result()
+            print(f"\rRendered {done_frames}/{len(frames)} frames", end="", file=sys.stderr)
+    print(f"\nRendered {len(frames)} frames in {time.perf_counter() - started:.1f} s to {directory}", file=sys.stderr)
+
+    write_ffconcat(directory, len(frames), durations)
+    if gif:
+        write_gif([os.path.join(directory, f"frame_{i:06d}.png") for i in range(len(frames))], args.export, durations)
+        print(f"Wrote {args.export}", file=sys.stderr)
+
+def run_mine(args):
+    message = args.messages[0] if args.messages else ""
+    miner = Miner(message.encode(), args.mine, args.double, args.jobs)
+    while miner.running():
+        miner.thread.join(0.5)
+        print(f"\r{miner.attempts:,} attempts, {miner.hashrate() / 1e6:.2f} MH/s", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    print(json.dumps({"message": message, "bits": miner.bits, "double": miner.double, "nonce": miner.nonce,
+                      "nonce_hex": f"{miner.nonce:016x}", "sha256": miner.digest, "attempts": miner.attempts,
+                      "seconds": round(miner.elapsed, 3), "hashrate": round(miner.hashrate())}))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SHA-256 Algorithm Visualization")
+    parser.add_argument("--headless", action="store_true",
+                        help="export the step-by-step trace without opening a window")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--file", action="append", default=[], help="hash the contents of a file")
+    parser.add_argument("-o", "--output", help="write the trace here instead of stdout")
+    parser.add_argument("--engine", choices=("python", "numpy"), default="python",
+                        help="numpy: trace many messages in lockstep (needs NumPy)")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--export", metavar="PATH",
+                        help="render every frame of the walkthrough of the first message to a PNG "
+                             "directory, or to an animated GIF if PATH ends with .gif (needs Pillow)")
+    parser.add_argument("--jobs", type=int, help="processes used by --export and mining (default: all cores)")
+    parser.add_argument("--scale", type=float, default=1.0, help="frame scale for --export")
+    parser.add_argument("--speed", type=playback_speed, default=1.0,
+                        help="animation speed, 0.25 to 16 (live window and --export timings; + / - while running)")
+    parser.add_argument("--save-trace", metavar="PATH",
+                        help="compute the trace of the first message (or --file) and save it for --trace")
+    parser.add_argument("--trace", metavar="PATH", help="open a trace saved with --save-trace or Ctrl+S")
+    parser.add_argument("--record", metavar="PATH", help="record the input events of this session")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="replay a recorded session without a window and report per-step frame times")
+    parser.add_argument("--report", metavar="PATH", help="write the --replay timings as JSON")
+    parser.add_argument("--budget-ms", type=float, default=1000 / 60,
+                        help="frame time budget for --replay (default: 60 FPS)")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+                        help=f"broadcast this session to followers (e.g. {SERVE_PORT})")
+    parser.add_argument("--follow", metavar="HOST[:PORT]", help="show the session broadcast by a --serve presenter")
+    parser.add_argument("--mine", type=mining_bits, metavar="BITS",
+                        help="find a nonce giving a digest with BITS leading zero bits, without a window")
+    parser.add_argument("--double", action="store_true", help="mine with double SHA-256")
+    parser.add_argument("--frame-cache-mb", type=int, default=256,
+                        help="memory for composed frames kept for back/forward navigation (0 = off)")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="report import, init and first-frame latency, then exit")
+    parser.add_argument("messages", nargs="*",
+                        help="messages to trace; with --headless and no inputs, one message per stdin line")
+    return parser.parse_args(argv)
+
+class PerfMonitor:
+    # F3: frame-time overlay, F4: cProfile capture of the current step
+    FRAME_BUDGET = 1 / 60
+
+    def __init__(self):
+        self.visible = False
+        self.frame_times = deque(maxlen=150)
+        self.step_times = {}
+        self.rect = pygame.Rect(WIDTH - 330, HEIGHT - 230, 320, 220)
+        self.panel = None
+        self.panel_built = 0
+        self.profiler = None
+        self.profile_step = None
+
+    def toggle_overlay(self):
+        self.visible = not self.visible
+        self.panel = None
+
+    def toggle_profile(self, step):
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profile_step = step
+            print(f"Profiling step {step}...", file=sys.stderr)
+        else:
+            self.stop_profile()
+
+    def stop_profile(self):
+        path = f"profile_step{self.profile_step}_{time.strftime('%Y%m%d-%H%M%S')}.pstats"
+        self.profiler.dump_stats(path)
+        print(f"Profile written to {path}", file=sys.stderr)
+        self.profiler = None
+        self.profile_step = None
+
+    def begin_frame(self, step):
+        if self.profiler is not None:
+            # Only the step that was on screen when the capture started
+            if step != self.profile_step:
+                self.stop_profile()
+            else:
+                self.profiler.enable()
+
+    def end_frame(self, step, update_time, draw_time, present_time):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.frame_times.append(update_time + draw_time + present_time)
+        times = self.step_times.get(step)
+        if times is None:
+            times = self.step_times[step] = deque(maxlen=60)
+        times.append((update_time, draw_time, present_time))
+
+    def build_panel(self, fps):
+        panel = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 190))
+        ms = [t * 1000 for t in self.frame_times]
+        worst = max(ms) if ms else 0
+        lines = [f"{fps:5.1f} fps   frame {ms[-1] if ms else 0:6.2f} ms   max {worst:6.2f} ms"]
+        for step in sorted(self.step_times):
+            times = self.step_times[step]
+            update, draw, present = (sum(t[i] for t in times) / len(times) * 1000 for i in range(3))
+            lines.append(f"Step {step}: update {update:5.2f}  draw {draw:5.2f}  flip {present:5.2f} ms")
+        if self.profiler is not None:
+            lines.append(f"Profiling step {self.profile_step} (F4 to stop)")
+        for i, line in enumerate(lines):
+            panel.blit(small_font.render(line, True, WHITE), (8, 6 + i * 18))
+
+        # Histogram of the last frames; the yellow line is the 60 FPS budget
+        base = self.rect.h - 8
+        scale = 60 / (2 * self.FRAME_BUDGET * 1000)
+        for i, value in enumerate(ms):
+            height = min(60, max(1, int(value * scale)))
+            color = GREEN if value <= self.FRAME_BUDGET * 1000 else RED
+            pygame.draw.line(panel, color, (8 + i * 2, base), (8 + i * 2, base - height))
+        budget_y = base - int(self.FRAME_BUDGET * 1000 * scale)
+        pygame.draw.line(panel, YELLOW, (8, budget_y), (self.rect.w - 8, budget_y))
+        return panel
+
+    def draw_overlay(self, screen, visualizer, dirty, fps):
+        now = time.perf_counter()
+        if self.panel is None or now - self.panel_built > 0.25:
+            self.panel = self.build_panel(fps)
+            self.panel_built = now
+        if dirty is not None:
+            # Restore what is under the panel before drawing it again
+            screen.blit(visualizer.shown, self.rect, self.rect)
+            dirty = dirty + [self.rect]
+        screen.blit(self.panel, self.rect)
+        return dirty
+
+def wait_for_events(timeout):
+    # Blocks until an event arrives or timeout (seconds, None = forever) runs out
+    if timeout is not None and timeout <= 0:
+        return pygame.event.get()
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        # +1 ms so the animation timer has really expired when we wake up
+        event = pygame.event.wait(int(timeout * 1000) + 1)
+    events = [] if event.type == pygame.NOEVENT else [event]
+    return events + pygame.event.get()
+
+def report_startup(init_started, init_done, first_frame_done, out=sys.stderr):
+    def ms(seconds):
+        return f"{seconds * 1000:8.1f} ms"
+    print(f"import:      {ms(IMPORTED_AT - STARTED_AT)}", file=out)
+    print(f"init:        {ms(init_done - init_started)}  (fonts: {'warm cache' if fonts_from_cache else 'cold, system scan'})", file=out)
+    print(f"first frame: {ms(first_frame_done - init_done)}", file=out)
+    print(f"total:       {ms(first_frame_done - STARTED_AT)}", file=out)
+
+def handle_event(visualizer, perf, event):
+    # Returns False when the window should close
+    if event.type == pygame.QUIT:
+        return False
+    elif event.type == pygame.VIDEOEXPOSE:
+        visualizer.invalidate()
+    elif event.type == pygame.DROPFILE:
+        if visualizer.open_file(event.file):
+            visualizer.next_step()
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+        perf.toggle_overlay()
+        visualizer.invalidate()
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+        perf.toggle_profile(visualizer.current_step)
+    elif (event.type == pygame.KEYDOWN and event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL
+          and visualizer.current_step > 0):
+        visualizer.save_trace()
+    elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and visualizer.timeline_hit(event.pos):
+        visualizer.scrubbing = True
+        visualizer.seek_to_x(event.pos[0])
+    elif event.type == pygame.MOUSEMOTION and visualizer.scrubbing:
+        visualizer.seek_to_x(event.pos[0])
+    elif event.type == pygame.MOUSEBUTTONUP:
+        visualizer.scrubbing = False
+    elif event.type == pygame.MOUSEWHEEL:
+        # Recorded wheel events carry the pointer position
+        visualizer.handle_wheel(getattr(event, 'pos', None) or pygame.mouse.get_pos(), event.y)
+    elif visualizer.current_step == 0:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_BACKSPACE:
+                visualizer.message = visualizer.text[:-1]
+            elif event.key == pygame.K_RETURN:
+                visualizer.update_message(visualizer.text)
+                visualizer.next_step()
+            else:
+                visualizer.message += event.unicode
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if visualizer.button_box.collidepoint(event.pos):
+                visualizer.update_message(visualizer.text)
+                visualizer.next_step()
+    elif event.type == pygame.KEYDOWN and visualizer.handle_mining_key(event.key):
+        pass
+    elif event.type == pygame.KEYDOWN and visualizer.goto_text is not None:
+        visualizer.handle_goto_key(event)
+    elif event.type == pygame.KEYDOWN and visualizer.handle_scroll_key(event.key, event.mod):
+        pass
+    elif event.type == pygame.KEYDOWN and visualizer.handle_timeline_key(event.key):
+        pass
+    elif event.type == pygame.KEYDOWN:
+        if event.key == pygame.K_LEFT:
+            visualizer.prev_step()
+        elif event.key == pygame.K_RIGHT:
+            visualizer.next_step()
+        elif event.key == pygame.K_DOWN:
+            visualizer.select_block(visualizer.current_block + 1)
+        elif event.key == pygame.K_UP:
+            visualizer.select_block(visualizer.current_block - 1)
+        elif event.key == pygame.K_a:
+            visualizer.toggle_avalanche()
+        elif event.key == pygame.K_b:
+            visualizer.toggle_bits()
+        elif event.key == pygame.K_m:
+            visualizer.toggle_mining()
+        elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            visualizer.clock.change_speed(1)
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            visualizer.clock.change_speed(-1)
+        elif event.key == pygame.K_ESCAPE:
+            visualizer.update_message("")
+            visualizer.current_step = 0
+    return True
+
+def run_frame(screen, visualizer, perf, fps):
+    # update + render + present; returns the three durations in seconds
+    step = visualizer.current_step
+    perf.begin_frame(step)
+    frame_started = time.perf_counter()
+    visualizer.update()
+    updated = time.perf_counter()
+    dirty = visualizer.render(screen)
+    drawn = time.perf_counter()
+    if perf.visible:
+        dirty = perf.draw_overlay(screen, visualizer, dirty, fps)
+    present_started = time.perf_counter()
+    if dirty is None:
+        pygame.display.flip()
+    elif dirty:
+        pygame.display.update(dirty)
+    times = (updated - frame_started, drawn - updated, time.perf_counter() - present_started)
+    perf.end_frame(step, *times)
+    return times
+
+# Ghi lại phiên dùng (--record) rồi phát lại không cần màn hình (--replay) để đo hiệu năng.
+# One JSON object per line: a header, then every input event with its time since the start.
+RECORDED_EVENTS = {
+    pygame.KEYDOWN: ('key', 'mod', 'unicode'),
+    pygame.MOUSEBUTTONDOWN: ('pos', 'button'),
+    pygame.MOUSEBUTTONUP: ('pos', 'button'),
+    pygame.MOUSEMOTION: ('pos',),
+    pygame.MOUSEWHEEL: ('y', 'pos'),
+    pygame.DROPFILE: ('file',),
+    pygame.QUIT: (),
+}
+EVENT_TYPES = {pygame.event.event_name(event_type): event_type for event_type in RECORDED_EVENTS}
+
+class SessionRecorder:
+    # Event times are taken from the clock's real-time source, so the speed does not change them
+    def __init__(self, path, message, clock, trace_path=None):
+        self.file = open(path, 'w')
+        self.clock = clock
+        self.started = clock.source()
+        self.write({"session": 1, "message": message, "trace": trace_path, "speed": clock.speed})
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record(self, events):
+        for event in events:
+            fields = RECORDED_EVENTS.get(event.type)
+            if fields is None or (event.type == pygame.MOUSEMOTION and not event.buttons[0]):
+                continue
+            record = {"t": round(self.clock.source() - self.started, 4), "type": pygame.event.event_name(event.type)}
+            for field in fields:
+                if event.type == pygame.MOUSEWHEEL and field == 'pos':
+                    record[field] = pygame.mouse.get_pos()
+                else:
+                    record[field] = getattr(event, field)
+            self.write(record)
+
+    def close(self):
+        self.file.close()
+
+def load_session(path):
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        records = [json.loads(line) for line in f if line.strip()]
+    if header.get("session") != 1:
+        raise ValueError(f"{path} is not a recorded session")
+    events = []
+    for record in records:
+        attributes = {field: tuple(value) if field == 'pos' else value
+                      for field, value in record.items() if field not in ("t", "type")}
+        events.append((record["t"], pygame.event.Event(EVENT_TYPES[record["type"]], attributes)))
+    return header, events
+
+def replay_session(path):
+    # Runs a recorded session as fast as possible on a virtual clock, frame by frame as the live
+    # loop would (at most 60 per second, only when an event or animation is due).
+    # Returns one dict per frame with its real update/draw/present times.
+    header, events = load_session(path)
+    virtual = VirtualClock()
+    clock = PlaybackClock(virtual, header.get("speed", 1))
+    screen = init_display()
+    visualizer = SHA256Visualizer(clock)
+    visualizer.message = header.get("message", "")
+    if header.get("trace"):
+        visualizer.open_trace(MappedTrace(header["trace"]))
+        visualizer.next_step()
+    perf = PerfMonitor()
+    frames = []
+    index = 0
+    running = True
+    while running:
+        while index < len(events) and events[index][0] <= virtual.now:
+            running = handle_event(visualizer, perf, events[index][1]) and running
+            index += 1
+        # Background traces finish before the frame so replays do not depend on thread timing
+        visualizer.finish_trace()
+        step = visualizer.current_step
+        update, draw, present = run_frame(screen, visualizer, perf, 60)
+        frames.append({"frame": len(frames), "t": round(virtual.now, 4), "step": step,
+                       "update_ms": update * 1000, "draw_ms": draw * 1000, "present_ms": present * 1000,
+                       "total_ms": (update + draw + present) * 1000})
+        if index >= len(events):
+            break
+        tick = clock() if perf.visible else visualizer.next_tick(clock())
+        due = events[index][0] if tick is None else min(virtual.now + clock.real_delay(tick), events[index][0])
+        virtual.now = max(due, virtual.now + 1 / 60)
+    if perf.profiler is not None:
+        perf.stop_profile()
+    return frames
+
+def fast_forward(message, pause=1.0):
+    # The walkthrough exactly as a live viewer sees it, played on a stepped virtual clock that
+    # jumps straight to every animation tick. Whenever nothing is animating the viewer waits
+    # pause seconds and presses RIGHT (or DOWN then LEFT for the next block).
+    # Returns (animation time, frame) for every change on screen.
+    virtual = VirtualClock()
+    clock = PlaybackClock(virtual)
+    visualizer = SHA256Visualizer(clock)
+    visualizer.update_message(message)
+    visualizer.finish_trace()
+    visualizer.next_step()
+    frames = []
+    while True:
+        visualizer.update()
+        frame = visualizer.current_frame()
+        if not frames or frames[-1][1] != frame:
+            frames.append((clock(), frame))
+        tick = visualizer.next_tick(clock())
+        if tick is not None:
+            # +1 ms, like the live loop, so the tick has really expired
+            virtual.advance(clock.real_delay(tick) + 0.001)
+            continue
+        step, block = visualizer.current_step, visualizer.current_block
+        if step >= 5 and block == len(visualizer.traces) - 1:
+            return frames
+        virtual.advance(pause)
+        if step >= 5:
+            visualizer.select_block(block + 1)
+            visualizer.prev_step()
+        else:
+            visualizer.next_step()
+
+def session_report(frames, budget_ms):
+    by_step = {}
+    for frame in frames:
+        by_step.setdefault(frame["step"], []).append(frame)
+    report = {}
+    for step, step_frames in sorted(by_step.items()):
+        totals = sorted(frame["total_ms"] for frame in step_frames)
+        over = sorted((frame for frame in step_frames if frame["total_ms"] > budget_ms),
+                      key=lambda frame: -frame["total_ms"])
+        report[str(step)] = {
+            "frames": len(step_frames),
+            "mean_ms": sum(totals) / len(totals),
+            "p95_ms": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            "max_ms": totals[-1],
+            "over_budget": len(over),
+            "worst": over[:5],
+        }
+    return report
+
+def run_replay(args):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    frames = replay_session(args.replay)
+    report = session_report(frames, args.budget_ms)
+    print(f"{len(frames)} frames, budget {args.budget_ms:.1f} ms", file=sys.stderr)
+    print("step  frames   mean ms    p95 ms    max ms  over budget", file=sys.stderr)
+    for step, stats in report.items():
+        print(f"{step:>4}  {stats['frames']:6}  {stats['mean_ms']:8.2f}  {stats['p95_ms']:8.2f}  "
+              f"{stats['max_ms']:8.2f}  {stats['over_budget']:11}", file=sys.stderr)
+    for stats in report.values():
+        for frame in stats["worst"]:
+            print(f"  over budget: frame {frame['frame']} at {frame['t']:.2f} s, step {frame['step']}: "
+                  f"update {frame['update_ms']:.2f} + draw {frame['draw_ms']:.2f} + present {frame['present_ms']:.2f} ms",
+                  file=sys.stderr)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"budget_ms": args.budget_ms, "steps": report, "frames": frames}, f, indent=2)
+    pygame.quit()
+    if any(stats["over_budget"] for stats in report.values()):
+        sys.exit(1)
+
+# Một máy trình chiếu, nhiều máy theo dõi: JSON lines over plain TCP.
+# A message line (text + every midstate) is encoded once per digest and shared by all
+# followers; after that only (step, block, index, sub) frames are sent.
+SERVE_PORT = 8765
+
+def parse_address(value, default_host):
+    # "PORT", "HOST" or "HOST:PORT"
+    host, colon, port = value.rpartition(':')
+    if not colon and not port.isdigit():
+        host, port = port, ""
+    return host or default_host, int(port) if port else SERVE_PORT
+
+def message_payload(visualizer):
+    trace = visualizer.traces
+    # The message goes as hex: it need not be valid UTF-8 (mined nonces, binary traces)
+    record = {"type": "message", "digest": visualizer.final_hash, "label": visualizer.message,
+              "data": bytes(trace.message()).hex(),
+              "midstates": ''.join(f"{value:08x}" for value in trace.midstates)}
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode()
+
+class BroadcastServer:
+    # Runs an asyncio loop on its own thread; the presenter calls publish() after every frame.
+    # Each follower only holds a reference to the newest state, so a slow one skips frames
+    # (its socket drains at its own pace) instead of queueing them.
+    def __init__(self, host, port, cache_size=4):
+        self.host = host
+        self.port = port
+        self.cache_size = cache_size
+        self.payloads = OrderedDict()
+        self.latest = None
+        self.followers = set()
+        self.closing = False
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.follow, self.host, self.port))
+        except OSError as error:
+            self.error = error
+            self.started.set()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def shutdown(self):
+        # Followers leave their loop when woken; ones stuck on a full socket get a second
+        self.closing = True
+        self.server.close()
+        self.wake_followers()
+        for _ in range(100):
+            if not self.followers:
+                break
+            await asyncio.sleep(0.01)
+        self.loop.stop()
 
-def main():
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+        self.thread.join()
+
+    def publish(self, visualizer):
+        if visualizer.current_step == 0 or visualizer.job is not None or visualizer.traces.midstates is None:
+            # Followers need every midstate, which a FileTrace does not keep
+            return
+        digest = visualizer.final_hash
+        payload = self.payloads.get(digest)
+        if payload is None:
+            payload = self.payloads[digest] = message_payload(visualizer)
+            if len(self.payloads) > self.cache_size:
+                self.payloads.popitem(last=False)
+        else:
+            self.payloads.move_to_end(digest)
+        frame = visualizer.current_frame()
+        if self.latest is None or self.latest[0] != digest or self.latest[2] != frame:
+            frame_line = (json.dumps({"type": "frame", "digest": digest, "frame": frame}) + "\n").encode()
+            self.latest = (digest, payload, frame, frame_line)
+            self.loop.call_soon_threadsafe(self.wake_followers)
+
+    def wake_followers(self):
+        for wake in self.followers:
+            wake.set()
+
+    async def follow(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=64 * 1024)
+        wake = asyncio.Event()
+        self.followers.add(wake)
+        if self.latest is not None:
+            wake.set()
+        sent_digest = sent_frame = None
+        hung_up = False
+
+        async def watch_hangup():
+            # Followers never send anything; drain the socket until it closes
+            nonlocal hung_up
+            try:
+                while await reader.read(4096):
+                    pass
+            except ConnectionError:
+                pass
+            hung_up = True
+            wake.set()
+
+        watcher = asyncio.ensure_future(watch_hangup())
+        try:
+            while True:
+                await wake.wait()
+                wake.clear()
+                if hung_up or self.closing:
+                    break
+                digest, payload, frame, frame_line = self.latest
+                if digest != sent_digest:
+                    writer.write(payload)
+                    sent_digest = digest
+                if frame != sent_frame:
+                    writer.write(frame_line)
+                    sent_frame = frame
+                # Backpressure: wait for this follower's socket, other followers are unaffected
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            watcher.cancel()
+            self.followers.discard(wake)
+            writer.close()
+
+FOLLOW_EVENT = pygame.USEREVENT + 1
+
+def receive_broadcast(sock):
+    # Reader thread of a follower: every line becomes a pygame event, None when the link drops
+    with sock, sock.makefile('rb') as lines:
+        try:
+            for line in lines:
+                pygame.event.post(pygame.event.Event(FOLLOW_EVENT, record=json.loads(line)))
+        except OSError:
+            pass
+    pygame.event.post(pygame.event.Event(FOLLOW_EVENT, record=None))
+
+def apply_broadcast(visualizer, record):
+    if record["type"] == "message":
+        data = bytes.fromhex(record["data"])
+        raw = bytes.fromhex(record["midstates"])
+        trace = MessageTrace(pad_message(data), compute=False)
+        # Midstates come from the presenter; only the block on screen is compressed here
+        trace.resume_from(array('I', struct.unpack(f'>{len(raw) // 4}I', raw)))
+        visualizer.update_message(record["label"], trace)
+    elif record["type"] == "frame" and record["digest"] == visualizer.final_hash:
+        visualizer.apply_frame(tuple(record["frame"]))
+
+def follow(address):
+    host, port = parse_address(address, 'localhost')
+    screen = init_display()
+    pygame.display.set_caption(f"SHA-256 Visualization - following {host}:{port}")
+    sock = socket.create_connection((host, port))
+    threading.Thread(target=receive_broadcast, args=(sock,), daemon=True).start()
     visualizer = SHA256Visualizer()
-    # visualizer.update_message("hello")
-    clock = pygame.time.Clock()
+    status = "Waiting for the presenter..."
     running = True
-    
     while running:
-        for event in pygame.event.get():
+        for event in wait_for_events(None):
             if event.type == pygame.QUIT:
                 running = False
-            elif visualizer.current_step == 0:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_BACKSPACE:
-                        visualizer.message = visualizer.text[:-1]
-                    elif event.key == pygame.K_RETURN:
-                        visualizer.update_message(visualizer.text)
-                        visualizer.next_step()
-                    else:
-                        visualizer.message += event.unicode
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if visualizer.button_box.collidepoint(event.pos):
-                        visualizer.update_message(visualizer.text)
-                        visualizer.next_step()
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT:
-                    visualizer.prev_step()
-                elif event.key == pygame.K_RIGHT:
-                    visualizer.next_step()
-                elif event.key == pygame.K_ESCAPE:
-                    visualizer.update_message("")
-                    visualizer.current_step = 0
-            
-        visualizer.update()
-        visualizer.draw(screen)
-        pygame.display.flip()
+            elif event.type == pygame.VIDEOEXPOSE:
+                visualizer.invalidate()
+            elif event.type == FOLLOW_EVENT and event.record is None:
+                status = "Disconnected from the presenter"
+                visualizer.invalidate()
+            elif event.type == FOLLOW_EVENT:
+                apply_broadcast(visualizer, event.record)
+                status = None
+        if status is not None:
+            screen.fill(WHITE)
+            text_cache.draw(screen, title_font, status, GRAY, (50, HEIGHT // 2))
+            pygame.display.flip()
+            continue
+        dirty = visualizer.render(screen)
+        if dirty is None:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+    pygame.quit()
+
+def main(message="", startup_time=False, trace_path=None, record_path=None, serve=None, frame_cache_mb=256, speed=1, jobs=None):
+    init_started = time.perf_counter()
+    screen = init_display()
+    init_done = time.perf_counter()
+    visualizer = SHA256Visualizer(PlaybackClock(speed=speed))
+    visualizer.frame_cache.max_bytes = frame_cache_mb * 1024 * 1024
+    visualizer.mine_jobs = jobs
+    visualizer.message = message
+    if trace_path:
+        visualizer.open_trace(MappedTrace(trace_path))
+        visualizer.next_step()
+    perf = PerfMonitor()
+    recorder = SessionRecorder(record_path, message, visualizer.clock, trace_path) if record_path else None
+    server = BroadcastServer(*parse_address(serve, '0.0.0.0')).start() if serve else None
+    if server is not None:
+        print(f"Broadcasting on port {server.port}", file=sys.stderr)
+    clock = pygame.time.Clock()
+    running = True
+    events = pygame.event.get()
+    
+    while running:
+        if recorder is not None:
+            recorder.record(events)
+        for event in events:
+            running = handle_event(visualizer, perf, event) and running
+
+        run_frame(screen, visualizer, perf, clock.get_fps())
+        if server is not None:
+            server.publish(visualizer)
+        if startup_time:
+            report_startup(init_started, init_done, time.perf_counter())
+            running = False
         clock.tick(60)
 
+        # Sleep until the next event or animation tick instead of redrawing a static screen
+        if perf.visible:
+            timeout = 0
+        else:
+            tick = visualizer.next_tick(visualizer.clock())
+            timeout = None if tick is None else visualizer.clock.real_delay(tick)
+        events = wait_for_events(timeout) if running else []
+
+    if recorder is not None:
+        recorder.close()
+    if server is not None:
+        server.stop()
+    visualizer.stop_mining()
+    if perf.profiler is not None:
+        perf.stop_profile()
     pygame.quit()
 
+IMPORTED_AT = time.perf_counter()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.headless:
+        run_headless(args)
+    elif args.export:
+        run_export(args)
+    elif args.save_trace:
+        run_save_trace(args)
+    elif args.mine is not None:
+        run_mine(args)
+    elif args.replay:
+        run_replay(args)
+    elif args.follow:
+        follow(args.follow)
+    else:
+        main(args.messages[0] if args.messages else "", startup_time=args.startup_time, trace_path=args.trace,
+             record_path=args.record, serve=args.serve, frame_cache_mb=args.frame_cache_mb,
+             speed=args.speed, jobs=args.jobs)
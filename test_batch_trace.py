@@ -0,0 +1,51 @@
+import os
+# Chạy không cần màn hình
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from hashlib import sha256
+
+import pytest
+
+import done
+
+pytest.importorskip("numpy")
+
+# Around the padding edges: 55 bytes is the longest one-block message, 119 the longest two-block one
+LENGTHS = [0, 55, 56, 63, 64, 119, 120]
+
+def message(length, seed=0):
+    return bytes((i * 31 + seed) % 256 for i in range(length))
+
+# Block counts 1, 2 and 3 interleaved, so every batch holds several BatchTrace groups
+MIXED = [message(length, seed) for seed, length in enumerate(LENGTHS * 3 + [1000, 3, 130, 0])]
+
+def python_records(messages):
+    return [record for n, data in enumerate(messages) for record in done.iter_trace_records(data, n)]
+
+def test_batch_trace_matches_hashlib():
+    messages = [message(length) for length in LENGTHS]
+    trace = done.BatchTrace(messages)
+    assert trace.verify(messages)
+    for n, data in enumerate(messages):
+        assert trace.hexdigest(n) == sha256(data).hexdigest()
+        assert int(trace.block_counts[n]) == len(done.pad_message(data)) // 64
+
+def test_batch_trace_matches_python_trace():
+    trace = done.BatchTrace(MIXED)
+    assert trace.verify(MIXED)
+    for n, data in enumerate(MIXED):
+        python = done.MessageTrace(done.pad_message(data))
+        for index in range(len(python)):
+            block = python[index]
+            assert list(trace.w[n, index]) == list(block.w)
+            assert [list(state) for state in trace.rounds[n, index]] == [list(block.state_after(i)) for i in range(64)]
+            assert list(trace.midstates[n, index + 1]) == list(block.h_out)
+
+@pytest.mark.parametrize("batch_size", [1, 5, 4096])
+def test_batch_records_match_python_records(batch_size):
+    records = list(done.iter_batch_trace_records(((n, data, None) for n, data in enumerate(MIXED)), batch_size))
+    assert records == python_records(MIXED)
+    digests = [record for record in records if record["record"] == "digest"]
+    assert [record["sha256"] for record in digests] == [sha256(data).hexdigest() for data in MIXED]
+    assert all(record["verified"] for record in digests)
@@ -0,0 +1,97 @@
+import os
+# Chạy không cần màn hình
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import asyncio
+import json
+import socket
+
+import done
+
+# Not valid UTF-8, and long enough (1025 blocks) to fill the socket of a follower that never reads
+BINARY_MESSAGE = bytes(range(128, 256)) * 512
+
+class StandInFollower:
+    # What `--follow` does with the stream, without a window: every record is kept and applied
+    def __init__(self):
+        self.records = []
+        self.visualizer = done.SHA256Visualizer()
+
+    async def connect(self, port):
+        # A message line holds the whole message and its midstates
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port, limit=16 * 1024 * 1024)
+
+    async def read_until(self, frame):
+        # Reads until the presenter's frame is on screen
+        while self.visualizer.current_frame() != frame or self.visualizer.current_step == 0:
+            line = await self.reader.readline()
+            assert line, "presenter closed the connection"
+            record = json.loads(line)
+            self.records.append(record)
+            done.apply_broadcast(self.visualizer, record)
+
+    def message_digests(self):
+        return [record["digest"] for record in self.records if record["type"] == "message"]
+
+def presenter(message, trace=None):
+    visualizer = done.SHA256Visualizer()
+    visualizer.update_message(message, trace)
+    return visualizer
+
+async def stalled_follower(port):
+    # Connects with a tiny receive buffer and never reads
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    return sock
+
+async def broadcast_session():
+    server = done.BroadcastServer('127.0.0.1', 0).start()
+    try:
+        stalled = await stalled_follower(server.port)
+        followers = [StandInFollower() for _ in range(3)]
+        for follower in followers:
+            await follower.connect(server.port)
+
+        binary = presenter("binary (65536 bytes)", done.MessageTrace(done.pad_message(BINARY_MESSAGE)))
+        text = presenter("abc" * 30)
+        # The typed message is played as a viewer sees it; the binary one jumps to its last round
+        walkthroughs = [(binary, [(5, len(binary.traces) - 1, 63, 1)]),
+                        (text, [frame for _, frame in done.fast_forward("abc" * 30)])]
+        published = []
+        for visualizer, frames in walkthroughs:
+            for frame in frames:
+                visualizer.apply_frame(frame)
+                server.publish(visualizer)
+                await asyncio.sleep(0)
+            published.append(visualizer.final_hash)
+            # Every follower catches up before the presenter moves on to the next message
+            await asyncio.wait_for(asyncio.gather(*(follower.read_until(visualizer.current_frame())
+                                                    for follower in followers)), 10)
+        stalled.close()
+        return binary, text, published, followers
+    finally:
+        server.stop()
+
+def test_broadcast_to_stand_in_followers():
+    binary, text, published, followers = asyncio.run(broadcast_session())
+    for follower in followers:
+        # One message line per digest, however many frames were sent
+        assert follower.message_digests() == published
+        # The follower rebuilt the presenter's trace from the bytes and midstates it received
+        visualizer = follower.visualizer
+        assert bytes(visualizer.message_bytes) == b"abc" * 30
+        assert visualizer.final_hash == text.final_hash == visualizer.traces.hexdigest()
+        assert visualizer.current_frame() == text.current_frame()
+        block = visualizer.current_block
+        assert list(visualizer.traces[block].rounds) == list(text.traces[block].rounds)
+
+def test_binary_message_survives_the_payload():
+    binary = presenter("binary", done.MessageTrace(done.pad_message(BINARY_MESSAGE)))
+    follower = done.SHA256Visualizer()
+    done.apply_broadcast(follower, json.loads(done.message_payload(binary)))
+    assert bytes(follower.message_bytes) == BINARY_MESSAGE
+    assert follower.final_hash == binary.final_hash == follower.traces.hexdigest()
+    assert list(follower.traces[700].w) == list(binary.traces[700].w)